@@ -1,10 +1,18 @@
+from dataclasses import dataclass, field
+from typing import List, Optional
 from langgraph.prebuilt import create_react_agent
 from langchain_openai import ChatOpenAI
-from langchain_core.messages import SystemMessage, AIMessage, HumanMessage
-from .mcp_client import get_mcp_tools
+from langchain_core.messages import SystemMessage, AIMessage, AIMessageChunk, HumanMessage
+from .mcp_client import mcp_manager
 from .config import settings
 from .table_helper import resolve_table
-import re
+from .staff_directory import staff_directory
+from .response_filter import technical_matcher, is_technical_line
+from .intent import analyze_user_intent
+from .normalizer import normalize_user_text
+from .usage import usage_tracker
+from .memory import MemoryState, chat_memory, make_history_hook
+from .command_router import command_router
 
 BASE_POLICY = (    f"Use ONLY the Lark MCP base with base_id: {settings.LARK_ALLOWED_BASE_ID}. "
 
@@ -67,107 +75,19 @@ TASK_EXPERT_MANAGER_PROMPT = """
 - การจัดการ channel/group: เข้า admin panel ของ channel/group นั้น
 
 การทักทายพนักงาน:
-- ใช้ MCP tools ค้นหาชื่อพนักงานจาก ChatId ใน Lark Base
-- ค้นหาด้วย filter ChatId = {telegram_chat_id} 
-- เมื่อพบชื่อแล้ว ให้ทักทายด้วยชื่อที่ถูกต้อง เช่น "สวัสดีครับคุณ {NameStaff}!"
+- ระบบจะค้นหาชื่อพนักงานจาก Chat ID และทักทายให้อัตโนมัติ
+- ไม่ต้องใช้ MCP tools ค้นหาชื่อพนักงานเอง
 """
 
-def analyze_user_intent(user_text: str) -> dict:
-    """Analyze user intent and suggest appropriate table/action"""
-    text = user_text.lower()
-    
-    # Intent patterns for different table types
-    intent_mapping = {
-        "customer": {
-            "keywords": ["ลูกค้า", "ลค", "customer", "client", "คัสเตอเมอร์"],
-            "actions": ["เพิ่มลูกค้า", "ข้อมูลลูกค้า", "แก้ไขลูกค้า"]
-        },
-        "task": {
-            "keywords": ["งาน", "งน", "task", "work", "ทำงาน", "โปรเจค", "project"],
-            "actions": ["งานวันนี้", "งานใหม่", "เพิ่มงาน", "สถานะงาน"]
-        },
-        "sales": {
-            "keywords": ["ขาย", "ขย", "sale", "ยอดขาย", "เงิน", "รายได้", "กำไร"],
-            "actions": ["ยอดขาย", "สถิติขาย", "รายงานขาย"]
-        },
-        "employee": {
-            "keywords": ["พนักงาน", "คน", "ทีม", "staff", "employee", "hr"],
-            "actions": ["คนใหม่", "เพิ่มพนักงาน", "ข้อมูลพนักงาน"]
-        },
-        "inventory": {
-            "keywords": ["สินค้า", "สต็อก", "คลัง", "product", "inventory"],
-            "actions": ["เช็คสินค้า", "เพิ่มสินค้า", "สต็อกสินค้า"]
-        }
-    }
-    
-    # Check for specific table indicators
-    detected_table = None
-    confidence = 0
-    
-    for table_type, patterns in intent_mapping.items():
-        score = 0
-        # Check keywords
-        for keyword in patterns["keywords"]:
-            if keyword in text:
-                score += 2
-        
-        # Check action patterns
-        for action in patterns["actions"]:
-            if action in text:
-                score += 3
-        
-        if score > confidence:
-            confidence = score
-            detected_table = table_type
-    
-    # Detect actions
-    action_type = None
-    if any(word in text for word in ["เพิ่ม", "สร้าง", "ใหม่", "add", "create"]):
-        action_type = "create"
-    elif any(word in text for word in ["ดู", "แสดง", "ข้อมูล", "รายการ", "list", "show"]):
-        action_type = "read"
-    elif any(word in text for word in ["แก้", "อัปเดต", "เปลี่ยน", "update", "edit"]):
-        action_type = "update"
-    elif any(word in text for word in ["ลบ", "delete", "remove"]):
-        action_type = "delete"
-    
-    return {
-        "table": detected_table,
-        "action": action_type,
-        "confidence": confidence,
-        "should_ask": confidence < 2  # Ask if confidence is low
-    }
-
-def normalize_user_text(text: str) -> str:
-    """Normalize common typos and abbreviations in Thai"""
-    normalizations = {
-        "งน": "งาน",
-        "ลค": "ลูกค้า", 
-        "ขย": "ขาย",
-        "ขข": "ข้อมูล",
-        "เพิ่ม": "เพิ่มข้อมูล",
-        "ดู": "ดูข้อมูล",
-        "ลบ": "ลบข้อมูล"
-    }
-    
-    normalized = text
-    for old, new in normalizations.items():
-        normalized = normalized.replace(old, new)
-    
-    return normalized
+# Byte-identical on every request so the provider can cache the prefix;
+# anything that varies per message goes in later, smaller system messages
+STATIC_SYSTEM_PROMPT = "\n".join([TASK_EXPERT_MANAGER_PROMPT.strip(), TABLE_POLICY.strip(), BASE_POLICY.strip()])
+STATIC_SYSTEM_MESSAGE = SystemMessage(content=STATIC_SYSTEM_PROMPT)
 
 async def get_staff_name_by_chat_id(chat_id: str) -> str:
-    """Get staff name from Lark Base using Telegram chat ID"""
+    """Get staff name from the cached TEAM table directory using Telegram chat ID"""
     try:
-        # Use MCP tools to search for staff name by chat_id
-        # This will search in the configured tables for ChatId field
-        tools = await get_mcp_tools()
-        
-        # Build a search query to find staff by chat_id
-        # This assumes there's a table with ChatId and NameStaff fields
-        search_hint = f"ค้นหาพนักงานที่มี ChatId = {chat_id} และดึงชื่อ NameStaff มาให้"
-        return search_hint
-        
+        return await staff_directory.get_name(chat_id)
     except Exception as e:
         return ""
 
@@ -183,12 +103,7 @@ def extract_ai_response_only(messages) -> str:
             content = getattr(msg, "content", "")
             if content and content.strip():
                 # Skip if it looks like a tool call or system response
-                if not any(pattern in content for pattern in [
-                    "I'll", "I will", "Let me", "I need to", "I should",
-                    "Based on", "According to", "The result", "Here's what",
-                    "tool_calls", "function_call", "mcp__", "base_id",
-                    "table_id", "app_token"
-                ]):
+                if not technical_matcher.search(content):
                     ai_responses.append(content)
                     break
     
@@ -202,48 +117,15 @@ def filter_response(raw_response: str) -> str:
     lines = raw_response.split('\n')
     filtered_lines = []
     
-    # Patterns to hide from users
-    skip_patterns = [
-        "Use only the provided MCP tools",
-        "Use ONLY the Lark MCP base",
-        "Allowed tables (name -> id):",
-        "If the name is ambiguous or missing",
-        "If a mapped table_id is not in the hard allowlist",
-        "When the user mentions a table by name",
-        "table_id=",
-        "base_id:",
-        "Use table_id",
-        "MCP tools",
-        "Do NOT reference other bases",
-        "SystemMessage",
-        "HumanMessage",
-        "AIMessage",
-        "I'll help you",
-        "I will search",
-        "Let me search",
-        "Based on the search",
-        "According to",
-        "The result shows",
-        "mcp__",
-        "app_token",
-        "tool_calls",
-        "function_call"
-    ]
-    
     for line in lines:
-        # Skip lines that contain technical patterns
-        should_skip = any(pattern in line for pattern in skip_patterns)
-        
-        # Skip lines that look like system messages or debug info
-        if line.strip().startswith(('System:', 'DEBUG:', 'Error:', 'Tool:', 'Human:', 'AI:', 'I\'ll', 'I will', 'Let me', 'Based on')):
-            should_skip = True
-            
+        stripped = line.strip()
         # Skip empty lines and lines with only technical symbols
-        if not line.strip() or line.strip() in ['(no content)', '---', '***']:
-            should_skip = True
-            
-        if not should_skip:
-            filtered_lines.append(line)
+        if not stripped or stripped in ('(no content)', '---', '***'):
+            continue
+        # Skip lines with technical patterns or system/debug prefixes (one precompiled scan)
+        if is_technical_line(line):
+            continue
+        filtered_lines.append(line)
     
     # Join the filtered content
     result = '\n'.join(filtered_lines).strip()
@@ -277,106 +159,146 @@ def make_response_natural(response: str, staff_name: str = "") -> str:
     
     return natural_response
 
-async def build_agent(user_text: str = "", chat_id: str = ""):
-
-    tools = await get_mcp_tools()
-
-    model = ChatOpenAI(
-      model="gpt-5-mini",
-      api_key=settings.OPENAI_API_KEY,
-      temperature=0.1,  # Make responses more consistent
-      model_kwargs={
-          "reasoning_effort": "medium",  # Options: minimal, low, medium, high
-          "verbosity": "medium"          # Options: low, medium, high
-      }
-  )
-
-    # Enhanced prompt with chat_id context for staff lookup
-    enhanced_prompt = TASK_EXPERT_MANAGER_PROMPT
-    if chat_id:
-        enhanced_prompt += f"\n\nปัจจุบันผู้ใช้มี Telegram Chat ID: {chat_id} - ใช้ข้อมูลนี้ในการค้นหาชื่อพนักงานจากฐานข้อมูล"
-
-    sys = SystemMessage(content=enhanced_prompt)
-
-    messages = [sys]
-    name, tid = resolve_table(user_text)
-
-    if tid:
-        # Create a more natural hint message
-        hint = SystemMessage(content=f"ใช้ตาราง '{name}' (ID: {tid}) สำหรับการทำงานกับฐานข้อมูล")
-        messages.append(hint)
-
-    agent = create_react_agent(model, tools)
-
+# Compiled agent graphs keyed by (model settings, tool catalog key, catalog version)
+_AGENT_REGISTRY = {}
+
+def _model_settings() -> tuple:
+    return (
+        settings.OPENAI_MODEL,
+        settings.OPENAI_TEMPERATURE,
+        settings.OPENAI_REASONING_EFFORT,
+        settings.OPENAI_VERBOSITY,
+    )
+
+def _build_model() -> ChatOpenAI:
+    model_name, temperature, reasoning_effort, verbosity = _model_settings()
+    return ChatOpenAI(
+        model=model_name,
+        api_key=settings.OPENAI_API_KEY,
+        temperature=temperature,  # Make responses more consistent
+        stream_usage=True,  # usage (incl. cached tokens) on streamed replies too
+        callbacks=[usage_tracker],
+        model_kwargs={
+            "reasoning_effort": reasoning_effort,
+            "verbosity": verbosity
+        }
+    )
+
+async def _summarize_turns(summary: str, messages) -> str:
+    """Fold turns that left the memory window into the running summary"""
+    lines = []
+    for msg in messages:
+        content = msg.content if isinstance(msg.content, str) else str(msg.content)
+        if isinstance(msg, HumanMessage):
+            lines.append(f"ผู้ใช้: {content}")
+        elif isinstance(msg, AIMessage):
+            if content.strip():
+                lines.append(f"ผู้ช่วย: {content}")
+        else:
+            # Tool results keep the record IDs follow-ups refer to
+            lines.append(f"ผลลัพธ์: {content[:500]}")
+
+    limit = settings.MEMORY_SUMMARY_MAX_CHARS
+    reply = await _build_model().ainvoke([
+        SystemMessage(content=(
+            f"สรุปบทสนทนาต่อไปนี้รวมกับสรุปเดิมให้สั้นที่สุด ไม่เกิน {limit} ตัวอักษร "
+            "เก็บชื่อตาราง, record ID และสิ่งที่ผู้ใช้ขอไว้"
+        )),
+        HumanMessage(content=f"สรุปเดิม:\n{summary or '-'}\n\nบทสนทนา:\n" + "\n".join(lines)),
+    ])
+    return _chunk_text(reply).strip()[:limit]
+
+async def get_compiled_agent():
+    """Return the ReAct graph for the current tool catalog, compiling it only
+    when the model settings or the server's tool set change."""
+    catalog = await mcp_manager.get_catalog()
+    key = (_model_settings(), catalog.key, catalog.version, id(chat_memory.checkpointer))
+    agent = _AGENT_REGISTRY.get(key)
+    if agent is None:
+        agent = create_react_agent(
+            _build_model(),
+            catalog.tools,
+            state_schema=MemoryState,
+            pre_model_hook=make_history_hook(_summarize_turns, settings.MEMORY_MAX_TURNS),
+            checkpointer=chat_memory.checkpointer,
+        )
+        # Older catalog versions are never requested again
+        _AGENT_REGISTRY.clear()
+        _AGENT_REGISTRY[key] = agent
     return agent
 
+@dataclass
+class RequestContext:
+    """Everything derived from one incoming message, computed once and
+    consumed by the agent runner."""
+    prompt: str
+    chat_id: str = ""
+    normalized_text: str = ""
+    intent: dict = field(default_factory=dict)
+    table_name: Optional[str] = None
+    table_id: Optional[str] = None
+    staff_name: str = ""
+    system_messages: List[SystemMessage] = field(default_factory=list)
+
+    @property
+    def agent_input(self) -> dict:
+        # Only the new user turn is appended to the chat's history
+        return {
+            "messages": [HumanMessage(content=self.normalized_text)],
+            "system_messages": self.system_messages,
+        }
 
-async def run_task(prompt: str, chat_id: str = ""):
-    # Normalize user input and analyze intent
-    normalized_prompt = normalize_user_text(prompt)
-    intent_analysis = analyze_user_intent(normalized_prompt)
-
-    agent = await build_agent(normalized_prompt, chat_id)
-    
-    # Enhanced prompt with chat_id context and intelligent guidance
-    enhanced_prompt = TASK_EXPERT_MANAGER_PROMPT
-    if chat_id:
-      enhanced_prompt += f"""
-
-  ขั้นตอนสำคัญ - ค้นหาชื่อพนักงาน:
-  1. ใช้ MCP tools ค้นหาใน TEAM table (table_id: tbljNtxUp5aB5ID7)
-  2. ค้นหาด้วย filter: chat_id = {chat_id}  
-  3. ดึงข้อมูล name field มา
-  4. ทักทายด้วยชื่อจริง เช่น "สวัสดีครับคุณ[ชื่อ]!"
-
-  ตัวอย่าง MCP search:
-  {{
-      "filter": {{
-          "conditions": [
-              {{
-                  "field_name": "chat_id",
-                  "operator": "is",
-                  "value": ["{chat_id}"]
-              }}
-          ],
-          "conjunction": "and"
-      }},
-      "field_names": ["name", "chat_id"],
-      "table_id": "tbljNtxUp5aB5ID7"
-  }}
-  """
-    # Add intelligent table guidance based on intent analysis
-    if intent_analysis["table"] and intent_analysis["confidence"] >= 2:
-        enhanced_prompt += f"\n\nจากการวิเคราะห์: ควรใช้ตาราง {intent_analysis['table']} สำหรับคำขอนี้ (confidence: {intent_analysis['confidence']})"
-        if intent_analysis["action"]:
-            enhanced_prompt += f" และดำเนินการ {intent_analysis['action']}"
-    
-    messages = [SystemMessage(content=enhanced_prompt)]
-    
-    # Try existing table resolution first, then fall back to intelligent analysis
-    name, tid = resolve_table(normalized_prompt)
-    if tid:
-        hint = SystemMessage(content=f"ใช้ตาราง '{name}' (ID: {tid}) สำหรับการทำงานนี้")
-        messages.append(hint)
-    elif intent_analysis["table"] and not intent_analysis["should_ask"]:
+def _system_messages(ctx: RequestContext) -> List[SystemMessage]:
+    intent = ctx.intent
+    messages = [STATIC_SYSTEM_MESSAGE]
+
+    # Per-request hints follow the static prefix
+    if intent["table"] and intent["confidence"] >= 2:
+        guidance = f"จากการวิเคราะห์: ควรใช้ตาราง {intent['table']} สำหรับคำขอนี้ (confidence: {intent['confidence']})"
+        if intent["action"]:
+            guidance += f" และดำเนินการ {intent['action']}"
+        messages.append(SystemMessage(content=guidance))
+
+    # Explicit table resolution first, then fall back to intelligent analysis
+    if ctx.table_id:
+        messages.append(SystemMessage(content=f"ใช้ตาราง '{ctx.table_name}' (ID: {ctx.table_id}) สำหรับการทำงานนี้"))
+    elif intent["table"] and not intent["should_ask"]:
         # Use intelligent table suggestion when confidence is high
-        hint = SystemMessage(content=f"ตามการวิเคราะห์ ควรใช้ตาราง {intent_analysis['table']} สำหรับงานนี้")
-        messages.append(hint)
-    
-    messages.append({"role": "user", "content": normalized_prompt})
-
-    result = await agent.ainvoke({"messages": messages}, debug=False)
-
+        messages.append(SystemMessage(content=f"ตามการวิเคราะห์ ควรใช้ตาราง {intent['table']} สำหรับงานนี้"))
+
+    return messages
+
+async def build_request_context(prompt: str, chat_id: str = "") -> RequestContext:
+    """Normalize, classify and resolve the message once"""
+    normalized = normalize_user_text(prompt)
+    table_name, table_id = resolve_table(normalized)
+    ctx = RequestContext(
+        prompt=prompt,
+        chat_id=chat_id,
+        normalized_text=normalized,
+        intent=analyze_user_intent(normalized),
+        table_name=table_name,
+        table_id=table_id,
+        # Staff name comes from the cached directory, not from an LLM tool call
+        staff_name=await get_staff_name_by_chat_id(chat_id),
+    )
+    ctx.system_messages = _system_messages(ctx)
+    return ctx
+
+async def build_agent():
+    """The shared compiled agent; per-request context goes in the messages"""
+    return await get_compiled_agent()
+
+def _current_turn(messages) -> list:
+    """Messages from the latest user turn on; earlier turns are memory"""
+    for i in range(len(messages) - 1, -1, -1):
+        if isinstance(messages[i], HumanMessage):
+            return messages[i:]
+    return messages
+
+def _finish_run(result_messages, staff_name: str) -> str:
     # Extract only the final AI response, not intermediate steps or system messages
-    ai_response = extract_ai_response_only(result.get("messages", []))
-    
-    # Try to extract staff name from the response (if the agent found it)
-    staff_name = ""
-    # Look for patterns like "คุณ{name}" or similar
-    name_pattern = r'คุณ([^\s\!\?\\.]+)'
-    name_match = re.search(name_pattern, ai_response)
-    if name_match:
-        staff_name = name_match.group(1)
+    ai_response = extract_ai_response_only(_current_turn(result_messages))
     
     # Filter out technical messages and make response natural
     filtered_response = filter_response(ai_response)
@@ -384,7 +306,87 @@ async def run_task(prompt: str, chat_id: str = ""):
     
     return natural_response
 
+def _chunk_text(chunk) -> str:
+    content = chunk.content
+    if isinstance(content, str):
+        return content
+    # Content blocks (e.g. Responses API): keep only text parts
+    return "".join(b.get("text", "") for b in content if isinstance(b, dict) and b.get("type") == "text")
+
+async def _fast_path(ctx: RequestContext) -> Optional[str]:
+    """Answer plain read commands straight from MCP; None means use the agent"""
+    reply = await command_router.dispatch(ctx)
+    if reply is not None:
+        # Follow-ups ("แก้อันเมื่อกี้") reach the agent with this exchange in memory
+        await chat_memory.append(build_agent, ctx.chat_id, [
+            HumanMessage(content=ctx.normalized_text), AIMessage(content=reply),
+        ])
+    return reply
+
+async def run_task(prompt: str, chat_id: str = ""):
+    ctx = await build_request_context(prompt, chat_id)
+    fast = await _fast_path(ctx)
+    if fast is not None:
+        return fast
+    return await run_context(ctx)
+
+async def run_context(ctx: RequestContext) -> str:
+    agent = await build_agent()
+    config = await chat_memory.thread_config(ctx.chat_id)
+
+    try:
+        # One checkpoint per turn is all memory needs
+        result = await agent.ainvoke(ctx.agent_input, config=config, durability="exit", debug=False)
+    finally:
+        await chat_memory.release(config)
+
+    return _finish_run(result.get("messages", []), ctx.staff_name)
+
+async def run_task_streaming(prompt: str, chat_id: str = "", on_partial=None):
+    """Same as run_task, but awaits `on_partial(text)` with the answer so far
+    as model tokens arrive. Tool-calling steps are not streamed; the final
+    text still goes through filter_response/make_response_natural."""
+    ctx = await build_request_context(prompt, chat_id)
+    fast = await _fast_path(ctx)
+    if fast is not None:
+        return fast
+    return await run_context_streaming(ctx, on_partial)
+
+async def run_context_streaming(ctx: RequestContext, on_partial=None) -> str:
+    agent = await build_agent()
+    config = await chat_memory.thread_config(ctx.chat_id)
+
+    final_state = {}
+    current_id, partial = None, ""
+    try:
+        async for mode, payload in agent.astream(ctx.agent_input, config=config, durability="exit",
+                                                 stream_mode=["messages", "values"]):
+            if mode == "values":
+                final_state = payload
+                continue
+            chunk, metadata = payload
+            if metadata.get("langgraph_node") != "agent" or not isinstance(chunk, AIMessageChunk):
+                continue
+            if chunk.id != current_id:
+                current_id, partial = chunk.id, ""
+            if chunk.tool_call_chunks:
+                # This step is a tool call, not the answer
+                partial = ""
+                continue
+            text = _chunk_text(chunk)
+            if text and on_partial:
+                partial += text
+                await on_partial(partial)
+    finally:
+        await chat_memory.release(config)
+
+    return _finish_run(final_state.get("messages", []), ctx.staff_name)
+
 # Enhanced run_task function that can be called with chat_id
 async def run_task_with_greeting(prompt: str, telegram_chat_id: str = ""):
     """Main function to run task with personalized greeting based on chat_id"""
     return await run_task(prompt, telegram_chat_id)
+
+async def run_task_with_greeting_streaming(prompt: str, telegram_chat_id: str = "", on_partial=None):
+    """Streaming variant of run_task_with_greeting"""
+    return await run_task_streaming(prompt, telegram_chat_id, on_partial)
@@ -0,0 +1,188 @@
+# Chunked, concurrent batch writes to Bitable records
+# Lark accepts at most 500 records per batch call; imports of thousands of rows
+# are split into compliant chunks, sent a few at a time and retried when Lark
+# throttles us or reports a write conflict.
+
+import asyncio
+import hashlib
+import json
+import logging
+import random
+import uuid
+from dataclasses import dataclass, field
+from typing import AsyncIterable, AsyncIterator, Awaitable, Callable, Iterable, List, Optional, Union
+from .config import settings
+from .mcp_guard import ErrorCode, error_code
+
+logger = logging.getLogger(__name__)
+
+BATCH_LIMIT = 500
+
+BATCH_TOOLS = {
+    "create": "mcp__lark-tenant__bitable_v1_appTableRecord_batchCreate",
+    "update": "mcp__lark-tenant__bitable_v1_appTableRecord_batchUpdate",
+    "delete": "mcp__lark-tenant__bitable_v1_appTableRecord_batchDelete",
+}
+
+# Throttling, same-table write conflicts and stalls are worth resending:
+# creates carry a client_token and updates/deletes are idempotent
+RETRYABLE_CODES = {ErrorCode.RATE_LIMITED, ErrorCode.CONFLICT, ErrorCode.TIMEOUT, ErrorCode.UNAVAILABLE}
+
+_VERBS = {"create": "เพิ่ม", "update": "แก้ไข", "delete": "ลบ"}
+
+def is_retryable(error: BaseException) -> bool:
+    return error_code(error) in RETRYABLE_CODES
+
+def chunk_client_token(table_id: str, operation: str, index: int, chunk: list, run_id: str = "") -> str:
+    """Same chunk of the same run -> same token, so a retried or re-sent
+    chunk is deduplicated by Lark instead of creating the rows twice.
+    Formatted as a UUIDv4, which is what Lark expects."""
+    payload = json.dumps(chunk, sort_keys=True, ensure_ascii=False, default=str)
+    digest = hashlib.sha256(f"{run_id}|{table_id}|{operation}|{index}|{payload}".encode("utf-8")).digest()
+    return str(uuid.UUID(bytes=digest[:16], version=4))
+
+async def _aiter(items: Union[Iterable, AsyncIterable]) -> AsyncIterator:
+    if hasattr(items, "__aiter__"):
+        async for item in items:
+            yield item
+    else:
+        for item in items:
+            yield item
+
+async def chunked(items: Union[Iterable, AsyncIterable], size: int) -> AsyncIterator[list]:
+    """Lazily group a (sync or async) stream into lists of at most `size`"""
+    chunk = []
+    async for item in _aiter(items):
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+@dataclass
+class ChunkFailure:
+    index: int
+    size: int
+    error: str
+
+@dataclass
+class BatchReport:
+    operation: str
+    total: int = 0
+    succeeded: int = 0
+    chunks: int = 0
+    retries: int = 0
+    failures: List[ChunkFailure] = field(default_factory=list)
+
+    @property
+    def failed(self) -> int:
+        return sum(f.size for f in self.failures)
+
+    @property
+    def ok(self) -> bool:
+        return not self.failures
+
+    def summary(self) -> str:
+        verb = _VERBS.get(self.operation, self.operation)
+        if self.ok:
+            return f"✅ {verb}ข้อมูล {self.succeeded} รายการเรียบร้อยแล้วครับ 📊"
+        return (
+            f"⚠️ {verb}ข้อมูลสำเร็จ {self.succeeded}/{self.total} รายการ "
+            f"ไม่สำเร็จ {self.failed} รายการ ({len(self.failures)} ชุด) ครับ"
+        )
+
+class BatchWriter:
+    """Sends batchCreate/batchUpdate/batchDelete in chunks of `chunk_size`.
+
+    At most `concurrency` chunks are in flight, and the input is only read
+    as fast as chunks are sent, so a large upload never sits in memory as a
+    whole. Bitable does not handle parallel writes to one table well, so
+    the default concurrency is low and write conflicts are retried like
+    rate limits. Only batchCreate takes a client_token; updates and deletes
+    of the same record IDs are naturally idempotent.
+    """
+
+    def __init__(self, client, app_token: str, chunk_size: int = None, concurrency: int = None,
+                 max_retries: int = None, base_delay: float = 1.0, max_delay: float = 30.0):
+        self.client = client
+        self.app_token = app_token
+        self.chunk_size = max(1, min(chunk_size or settings.BATCH_CHUNK_SIZE, BATCH_LIMIT))
+        self.concurrency = max(1, concurrency or settings.BATCH_CONCURRENCY)
+        self.max_retries = settings.BATCH_MAX_RETRIES if max_retries is None else max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    async def run(self, operation: str, table_id: str, records: Union[Iterable, AsyncIterable],
+                  run_id: str = "",
+                  on_progress: Optional[Callable[[BatchReport], Awaitable[None]]] = None) -> BatchReport:
+        """Write every record and report what went through.
+
+        create/update take record dicts ({"fields": ...} / {"record_id", "fields"}),
+        delete takes record IDs. `run_id` separates client_tokens of two
+        intentional imports of identical data."""
+        if operation not in BATCH_TOOLS:
+            raise ValueError(f"Unknown batch operation: {operation}")
+
+        report = BatchReport(operation)
+        slots = asyncio.Semaphore(self.concurrency)
+        tasks = set()
+
+        async def send(index: int, chunk: list):
+            try:
+                await self._send_chunk(operation, table_id, index, chunk, run_id, report)
+                report.succeeded += len(chunk)
+            except Exception as e:
+                logger.warning(f"Batch {operation} chunk {index} ({len(chunk)} records) failed: {e}")
+                report.failures.append(ChunkFailure(index, len(chunk), str(e)))
+            finally:
+                slots.release()
+            if on_progress:
+                try:
+                    await on_progress(report)
+                except Exception as e:
+                    logger.debug(f"Batch progress callback failed: {e}")
+
+        try:
+            index = 0
+            async for chunk in chunked(records, self.chunk_size):
+                # Backpressure: don't read the next chunk until a slot is free
+                await slots.acquire()
+                report.total += len(chunk)
+                report.chunks += 1
+                task = asyncio.create_task(send(index, chunk))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+                index += 1
+            if tasks:
+                await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
+        return report
+
+    async def _send_chunk(self, operation: str, table_id: str, index: int, chunk: list,
+                          run_id: str, report: BatchReport):
+        arguments = {
+            "data": {"records": chunk},
+            "path": {"app_token": self.app_token, "table_id": table_id},
+            "useUAT": False
+        }
+        if operation != "delete":
+            arguments["params"] = {"user_id_type": "open_id"}
+        if operation == "create":
+            arguments["params"]["client_token"] = chunk_client_token(table_id, operation, index, chunk, run_id)
+
+        attempt = 0
+        while True:
+            try:
+                return await self.client.call_tool(BATCH_TOOLS[operation], arguments)
+            except Exception as e:
+                if attempt >= self.max_retries or not is_retryable(e):
+                    raise
+                delay = min(self.max_delay, self.base_delay * 2 ** attempt) * random.uniform(0.5, 1.0)
+                attempt += 1
+                report.retries += 1
+                logger.info(f"Batch {operation} chunk {index} throttled, retry {attempt} in {delay:.1f}s")
+                await asyncio.sleep(delay)
@@ -0,0 +1,107 @@
+# Pre-LLM fast path for plain read commands
+# "ดูตาราง", "/users" or "ดูข้อมูลลูกค้า" need one MCP call, not a ReAct loop;
+# they go straight to LarkOperationsHandler. Anything with extra detail
+# (filters, names, writes) still goes to the agent.
+
+import logging
+import re
+import string
+from collections import Counter
+from typing import Optional, Tuple
+from .config import settings
+from .intent import INTENT_ACTIONS
+from .lark_commands import CommandRegistry, LarkCommand, lark_commands
+from .lark_handler import LarkOperationsHandler, lark_handler
+from .table_helper import table_resolver
+from .text_match import compile_phrases
+
+logger = logging.getLogger(__name__)
+
+# Words that carry no request detail; a message made only of a command,
+# a table name and these is safe to answer without the LLM
+FILLER_WORDS = [
+    "ทั้งหมด", "หน่อย", "ครับ", "คับ", "ค่ะ", "คะ", "นะ", "ขอ", "ให้", "ที", "ของ", "ใน",
+    "ตาราง", "table", "table:", "all", "please", "the", "of", "in",
+]
+
+# Plain "show me" words; intent phrases like "งานวันนี้" or "สถานะงาน" are
+# not in here because they carry a filter only the agent can apply
+READ_WORDS = dict(INTENT_ACTIONS)["read"]
+
+class CommandRouter:
+    """Decides whether a message can skip the agent.
+
+    Two ways in: a command alias from the registry (only those marked
+    `fast`, which are read-only) at the start of the message, or
+    a read intent on a resolved table ("แสดงรายการ ลูกค้า"). Either way
+    the rest of the message must be empty once table names, filler words
+    (and for intents, plain read words) are removed; otherwise the agent
+    handles it.
+    """
+
+    def __init__(self, handler: LarkOperationsHandler, registry: CommandRegistry, enabled: bool = True):
+        self.handler = handler
+        self.registry = registry
+        self.enabled = enabled
+        self._search = registry.get("search_records")
+        self._filler = compile_phrases(FILLER_WORDS)
+        self._filler_and_reads = compile_phrases(FILLER_WORDS + READ_WORDS)
+        self.routed = Counter()
+        self.fallbacks = 0
+
+    def _is_bare(self, text: str, filler=None) -> bool:
+        """Nothing left but table names, filler words, spaces and punctuation"""
+        rest = table_resolver.strip_names(text)
+        filler = filler or self._filler
+        if filler:
+            rest = filler.sub(" ", rest)
+        return not re.sub(r"\s+", "", rest).strip(string.punctuation + "ๆ")
+
+    def match(self, ctx) -> Optional[Tuple[LarkCommand, dict]]:
+        """(command, params) for a request that needs no LLM, else None"""
+        raw = (ctx.prompt or "").strip().lower()
+        hit = self.registry.match_prefix(raw)
+        if hit:
+            command, end = hit
+            # Longest alias wins, so "ดูข้อมูลผู้ใช้" is get_user_info and not fast
+            if not command.fast or not self._is_bare(raw[end:]):
+                return None
+            if command.needs_table:
+                return (command, self._params(command, ctx)) if ctx.table_id else None
+            if not ctx.table_id:
+                return command, {}
+            # "ดูตาราง ลูกค้า" is about the table's data, not the table list
+
+        intent = ctx.intent or {}
+        if ctx.table_id and intent.get("action") == "read":
+            if self._is_bare(ctx.normalized_text, self._filler_and_reads):
+                return self._search, self._params(self._search, ctx)
+        return None
+
+    def _params(self, command: LarkCommand, ctx) -> dict:
+        params = {"table_id": ctx.table_id}
+        if command is self._search:
+            params["limit"] = settings.FAST_PATH_SEARCH_LIMIT
+        return params
+
+    async def dispatch(self, ctx) -> Optional[str]:
+        """Answer directly when the request matches; None means use the agent"""
+        if not self.enabled:
+            return None
+        hit = self.match(ctx)
+        if hit is None:
+            self.fallbacks += 1
+            return None
+        command, params = hit
+        self.routed[command.method] += 1
+        logger.info(f"Fast path: {command.method} {params}")
+        return await command.invoke(self.handler, params)
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "routed": dict(self.routed),
+            "fallbacks": self.fallbacks,
+        }
+
+command_router = CommandRouter(lark_handler, lark_commands, settings.FAST_PATH_ENABLED)
@@ -3,12 +3,66 @@ import os, json
 class Settings:
     # Telegram
     TG_TOKEN = os.getenv("TG_TOKEN")
-    TG_API = f"https://api.telegram.org/bot{TG_TOKEN}" if TG_TOKEN else None
+    TG_API_BASE = os.getenv("TG_API_BASE", "https://api.telegram.org").rstrip("/")  # override for a local fake server
+    TG_API = f"{TG_API_BASE}/bot{TG_TOKEN}" if TG_TOKEN else None
+    TG_FILE_API = f"{TG_API_BASE}/file/bot{TG_TOKEN}" if TG_TOKEN else None
     TG_WEBHOOK_URL = os.getenv("TG_WEBHOOK_URL")
+    TG_INGEST_MODE = os.getenv("TG_INGEST_MODE", "webhook").lower()  # webhook | polling
+    TG_POLL_TIMEOUT = int(os.getenv("TG_POLL_TIMEOUT", "50"))
+    TG_POLL_LIMIT = int(os.getenv("TG_POLL_LIMIT", "100"))
+    TG_STREAMING = os.getenv("TG_STREAMING", "false").lower() in ("1","true","yes","y")
+    TG_EDIT_INTERVAL = float(os.getenv("TG_EDIT_INTERVAL", "1.5"))  # seconds between streamed edits
+
+    # Telegram HTTP connection pool
+    TG_CONNECTION_LIMIT = int(os.getenv("TG_CONNECTION_LIMIT", "20"))
+    TG_DNS_CACHE_TTL = int(os.getenv("TG_DNS_CACHE_TTL", "300"))
+    TG_KEEPALIVE_TIMEOUT = float(os.getenv("TG_KEEPALIVE_TIMEOUT", "60"))
+    TG_REQUEST_TIMEOUT = float(os.getenv("TG_REQUEST_TIMEOUT", "30"))
+
+    # Outbound Telegram limits (Bot API: ~30 msg/s overall, ~1 msg/s per chat, 20 msg/min per group)
+    TG_GLOBAL_RATE = float(os.getenv("TG_GLOBAL_RATE", "30"))
+    TG_CHAT_RATE = float(os.getenv("TG_CHAT_RATE", "1"))
+    TG_CHAT_BURST = float(os.getenv("TG_CHAT_BURST", "3"))
+    TG_GROUP_RATE_PER_MINUTE = float(os.getenv("TG_GROUP_RATE_PER_MINUTE", "20"))
+    TG_MAX_RETRIES = int(os.getenv("TG_MAX_RETRIES", "3"))  # resends after a 429
+
+    # Webhook processing queue
+    DISPATCH_WORKERS = int(os.getenv("DISPATCH_WORKERS", "4"))
+    DISPATCH_MAX_PENDING = int(os.getenv("DISPATCH_MAX_PENDING", "100"))
+
+    # Webhook update_id deduplication
+    DEDUP_BACKEND = os.getenv("DEDUP_BACKEND", "memory").lower()  # memory | redis
+    DEDUP_TTL = float(os.getenv("DEDUP_TTL", "3600"))
+    DEDUP_MAX_ENTRIES = int(os.getenv("DEDUP_MAX_ENTRIES", "10000"))
+    REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
 
     # Agent
     AGENT_JWT_SECRET = os.getenv("AGENT_JWT_SECRET", "change_me")
     OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+    OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-5-mini")
+    OPENAI_TEMPERATURE = float(os.getenv("OPENAI_TEMPERATURE", "0.1"))
+    OPENAI_REASONING_EFFORT = os.getenv("OPENAI_REASONING_EFFORT", "medium")  # minimal | low | medium | high
+    OPENAI_VERBOSITY = os.getenv("OPENAI_VERBOSITY", "medium")  # low | medium | high
+
+    # Pre-LLM fast path for plain read commands ("ดูตาราง", "list users", "ดูข้อมูลลูกค้า")
+    FAST_PATH_ENABLED = os.getenv("FAST_PATH_ENABLED", "true").lower() in ("1","true","yes","y")
+    FAST_PATH_SEARCH_LIMIT = int(os.getenv("FAST_PATH_SEARCH_LIMIT", "20"))
+
+    # Per-chat conversation memory (LangGraph checkpointer, thread_id = chat_id)
+    MEMORY_BACKEND = os.getenv("MEMORY_BACKEND", "memory").lower()  # memory | sqlite | off
+    MEMORY_SQLITE_PATH = os.getenv("MEMORY_SQLITE_PATH", "agent_memory.sqlite")
+    MEMORY_MAX_TURNS = int(os.getenv("MEMORY_MAX_TURNS", "6"))  # turns kept verbatim, older ones are summarized
+    MEMORY_MAX_CHATS = int(os.getenv("MEMORY_MAX_CHATS", "500"))  # least recently used chats are forgotten
+    MEMORY_SUMMARY_MAX_CHARS = int(os.getenv("MEMORY_SUMMARY_MAX_CHARS", "1500"))
+
+    # Bitable batch writes (Lark caps a batch call at 500 records)
+    BATCH_CHUNK_SIZE = int(os.getenv("BATCH_CHUNK_SIZE", "500"))
+    BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "2"))
+    BATCH_MAX_RETRIES = int(os.getenv("BATCH_MAX_RETRIES", "5"))
+
+    # CSV/XLSX uploads imported into Bitable (Bot API downloads are capped at 20 MB)
+    IMPORT_MAX_BYTES = int(os.getenv("IMPORT_MAX_BYTES", str(20 * 1024 * 1024)))
+    IMPORT_TIMEZONE = os.getenv("IMPORT_TIMEZONE", "Asia/Bangkok")  # for dates without a timezone
 
     # MCP modes
     MCP_MODE = os.getenv("MCP_MODE", "base")  # base | stream | sse
@@ -23,6 +77,29 @@ class Settings:
     LARK_MCP_AUTH_HEADER = os.getenv("LARK_MCP_AUTH_HEADER")
     LARK_MCP_AUTH_VALUE = os.getenv("LARK_MCP_AUTH_VALUE")
 
+    # Persistent MCP session (seconds)
+    MCP_CONNECT_TIMEOUT = float(os.getenv("MCP_CONNECT_TIMEOUT", "20"))
+    MCP_PING_INTERVAL = float(os.getenv("MCP_PING_INTERVAL", "30"))
+    MCP_PING_TIMEOUT = float(os.getenv("MCP_PING_TIMEOUT", "10"))
+    MCP_RECONNECT_MIN_BACKOFF = float(os.getenv("MCP_RECONNECT_MIN_BACKOFF", "1"))
+    MCP_RECONNECT_MAX_BACKOFF = float(os.getenv("MCP_RECONNECT_MAX_BACKOFF", "60"))
+    MCP_TOOL_CACHE_TTL = float(os.getenv("MCP_TOOL_CACHE_TTL", "300"))
+
+    # MCP tool calls: default deadline, read retries, circuit breaker (seconds)
+    MCP_CALL_TIMEOUT = float(os.getenv("MCP_CALL_TIMEOUT", "30"))
+    MCP_READ_RETRIES = int(os.getenv("MCP_READ_RETRIES", "2"))
+    MCP_BREAKER_THRESHOLD = int(os.getenv("MCP_BREAKER_THRESHOLD", "5"))
+    MCP_BREAKER_RESET = float(os.getenv("MCP_BREAKER_RESET", "30"))
+    RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() in ("1","true","yes","y")
+
+    # === Staff directory (TEAM table: chat_id -> name) ===
+    STAFF_TABLE_ID = os.getenv("STAFF_TABLE_ID", "tbljNtxUp5aB5ID7")
+    STAFF_CHAT_ID_FIELD = os.getenv("STAFF_CHAT_ID_FIELD", "chat_id")
+    STAFF_NAME_FIELD = os.getenv("STAFF_NAME_FIELD", "name")
+    STAFF_MODIFIED_FIELD = os.getenv("STAFF_MODIFIED_FIELD")  # optional "Last Modified" field for delta refresh
+    STAFF_DIRECTORY_TTL = float(os.getenv("STAFF_DIRECTORY_TTL", "3600"))
+    STAFF_REFRESH_INTERVAL = float(os.getenv("STAFF_REFRESH_INTERVAL", "300"))
+
     # === Base Lock (URL prefix) ===
     BASE_LOCK = os.getenv("BASE_LOCK", "true").lower() in ("1","true","yes","y")
     LARK_ALLOWED_BASE_PREFIX = os.getenv("LARK_ALLOWED_BASE_PREFIX")  # e.g., https://anycross.../mcp/lark_base/
@@ -43,4 +120,54 @@ class Settings:
     except Exception:
         ALLOWED_TABLE_IDS = []
 
+    # Extra names for mapped tables (e.g. Thai aliases): {"alias": "Table Name"}
+    TABLE_ALIASES_JSON = os.getenv("TABLE_ALIASES_JSON", "{}")
+    try:
+        TABLE_ALIASES = json.loads(TABLE_ALIASES_JSON)
+    except Exception:
+        TABLE_ALIASES = {}
+
+    # Extra intent tables for keyword classification: {"table": {"keywords": [...], "actions": [...]}}
+    INTENT_MAP_JSON = os.getenv("INTENT_MAP_JSON", "{}")
+    try:
+        INTENT_MAP = json.loads(INTENT_MAP_JSON)
+    except Exception:
+        INTENT_MAP = {}
+
+    # Extra Thai abbreviation / typo expansions: {"abbr": "expansion"}
+    NORMALIZE_MAP_JSON = os.getenv("NORMALIZE_MAP_JSON", "{}")
+    try:
+        NORMALIZE_MAP = json.loads(NORMALIZE_MAP_JSON)
+    except Exception:
+        NORMALIZE_MAP = {}
+
+    # Extra literal patterns hidden from user-facing replies
+    RESPONSE_FILTER_PATTERNS_JSON = os.getenv("RESPONSE_FILTER_PATTERNS_JSON", "[]")
+    try:
+        RESPONSE_FILTER_PATTERNS = json.loads(RESPONSE_FILTER_PATTERNS_JSON)
+    except Exception:
+        RESPONSE_FILTER_PATTERNS = []
+
+    # Read-tool result cache: per-tool TTL overrides in seconds, {"bitable_v1_appTable_list": 600}
+    TOOL_CACHE_MAX_ENTRIES = int(os.getenv("TOOL_CACHE_MAX_ENTRIES", "1000"))
+    TOOL_CACHE_TTLS_JSON = os.getenv("TOOL_CACHE_TTLS_JSON", "{}")
+    try:
+        TOOL_CACHE_TTLS = json.loads(TOOL_CACHE_TTLS_JSON)
+    except Exception:
+        TOOL_CACHE_TTLS = {}
+
+    # Per-tool (base name) or per-verb call deadlines in seconds, {"search": 30, "bitable_v1_appTable_list": 10}
+    MCP_TOOL_TIMEOUTS_JSON = os.getenv("MCP_TOOL_TIMEOUTS_JSON", "{}")
+    try:
+        MCP_TOOL_TIMEOUTS = json.loads(MCP_TOOL_TIMEOUTS_JSON)
+    except Exception:
+        MCP_TOOL_TIMEOUTS = {}
+
+    # Requests per second per tool family, {"bitable_record_write": 5, "contact": 20}
+    RATE_LIMITS_JSON = os.getenv("RATE_LIMITS_JSON", "{}")
+    try:
+        RATE_LIMITS = json.loads(RATE_LIMITS_JSON)
+    except Exception:
+        RATE_LIMITS = {}
+
 settings = Settings()
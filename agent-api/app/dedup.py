@@ -0,0 +1,94 @@
+# Telegram update_id deduplication
+# Telegram re-delivers webhook updates when we answer slowly; each retry would
+# otherwise run the agent (and any Lark writes) a second time.
+
+import logging
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+class DedupBackend(ABC):
+    """Storage for seen keys. Implementations must make add_if_absent atomic."""
+
+    @abstractmethod
+    async def add_if_absent(self, key: str, ttl: float) -> bool:
+        """Record `key` for `ttl` seconds; return False if it was already present."""
+
+    async def close(self):
+        pass
+
+class MemoryDedupBackend(DedupBackend):
+    """Bounded, time-windowed store for a single replica."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._seen: "OrderedDict[str, float]" = OrderedDict()
+
+    async def add_if_absent(self, key: str, ttl: float) -> bool:
+        now = time.monotonic()
+        # Entries share one TTL, so insertion order is expiry order
+        while self._seen:
+            oldest, expires = next(iter(self._seen.items()))
+            if expires > now and len(self._seen) < self.max_entries:
+                break
+            del self._seen[oldest]
+        if key in self._seen:
+            return False
+        self._seen[key] = now + ttl
+        return True
+
+class RedisDedupBackend(DedupBackend):
+    """Shared store across replicas (SET NX EX). Needs the optional `redis` package."""
+
+    def __init__(self, url: str):
+        try:
+            import redis.asyncio as redis
+        except ImportError:
+            raise RuntimeError("DEDUP_BACKEND=redis requires the 'redis' package (pip install redis)")
+        self._redis = redis.from_url(url)
+
+    async def add_if_absent(self, key: str, ttl: float) -> bool:
+        return bool(await self._redis.set(key, 1, nx=True, ex=max(1, int(ttl))))
+
+    async def close(self):
+        await self._redis.aclose()
+
+class UpdateDeduplicator:
+    def __init__(self, backend: DedupBackend, ttl: float, prefix: str = "tg:update:"):
+        self.backend = backend
+        self.ttl = ttl
+        self.prefix = prefix
+        self.seen = 0
+        self.duplicates = 0
+
+    async def is_duplicate(self, update_id) -> bool:
+        self.seen += 1
+        try:
+            fresh = await self.backend.add_if_absent(f"{self.prefix}{update_id}", self.ttl)
+        except Exception as e:
+            # Fail open: a missed dedup costs a retry, a false positive loses a message
+            logger.error(f"Dedup backend error: {e}")
+            return False
+        if not fresh:
+            self.duplicates += 1
+        return not fresh
+
+    async def close(self):
+        await self.backend.close()
+
+    def stats(self) -> dict:
+        return {
+            "backend": type(self.backend).__name__,
+            "seen": self.seen,
+            "duplicates": self.duplicates,
+        }
+
+def build_deduplicator() -> UpdateDeduplicator:
+    if settings.DEDUP_BACKEND == "redis":
+        backend = RedisDedupBackend(settings.REDIS_URL)
+    else:
+        backend = MemoryDedupBackend(settings.DEDUP_MAX_ENTRIES)
+    return UpdateDeduplicator(backend, settings.DEDUP_TTL)
@@ -0,0 +1,89 @@
+# Bounded in-process work queue for Telegram messages
+# Strict FIFO per chat_id, parallel across chats, with backpressure
+
+import asyncio
+import logging
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Hashable, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+class ChatDispatcher:
+    """Run `handler(chat_id, *args)` on a fixed worker pool.
+
+    A chat is owned by at most one worker at a time, so its jobs finish in
+    arrival order. After each job the chat goes to the back of the ready
+    queue, which keeps a busy group from starving other chats. `submit`
+    refuses work once `max_pending` jobs are queued or running.
+    """
+
+    def __init__(self, handler: Callable[..., Awaitable[Any]], workers: int, max_pending: int):
+        self._handler = handler
+        self.workers = workers
+        self.max_pending = max_pending
+        self._pending: Dict[Hashable, Deque[Tuple]] = {}
+        self._ready: asyncio.Queue = asyncio.Queue(maxsize=max_pending)
+        self._tasks: List[asyncio.Task] = []
+        self.depth = 0
+        self.processed = 0
+        self.failed = 0
+        self.rejected = 0
+
+    def submit(self, chat_id: Hashable, *args) -> bool:
+        if self.depth >= self.max_pending:
+            self.rejected += 1
+            return False
+        self.depth += 1
+        queue = self._pending.get(chat_id)
+        if queue is None:
+            self._pending[chat_id] = deque([args])
+            self._ready.put_nowait(chat_id)
+        else:
+            # Already queued or running; its worker will pick this up in order
+            queue.append(args)
+        return True
+
+    async def start(self):
+        if self._tasks:
+            return
+        self._tasks = [
+            asyncio.create_task(self._worker(), name=f"dispatch-worker-{i}")
+            for i in range(self.workers)
+        ]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def stats(self) -> dict:
+        return {
+            "queue_depth": self.depth,
+            "active_chats": len(self._pending),
+            "max_pending": self.max_pending,
+            "workers": self.workers,
+            "processed": self.processed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+        }
+
+    async def _worker(self):
+        while True:
+            chat_id = await self._ready.get()
+            queue = self._pending[chat_id]
+            args = queue.popleft()
+            try:
+                await self._handler(chat_id, *args)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.failed += 1
+                logger.error(f"Dispatch job for chat {chat_id} failed: {e}")
+            finally:
+                self.depth -= 1
+                self.processed += 1
+                if queue:
+                    self._ready.put_nowait(chat_id)
+                else:
+                    del self._pending[chat_id]
@@ -0,0 +1,136 @@
+# Keyword intent classifier: which table a message is about and what action it asks for
+# The intent table is plain data, extendable with INTENT_MAP_JSON without code changes
+
+import re
+from collections import defaultdict
+from typing import Dict, List, Tuple
+from .config import settings
+from .text_match import trie_pattern
+
+KEYWORD_WEIGHT = 2
+ACTION_WEIGHT = 3
+
+# Intent patterns for different table types
+INTENT_TABLES = {
+    "customer": {
+        "keywords": ["ลูกค้า", "ลค", "customer", "client", "คัสเตอเมอร์"],
+        "actions": ["เพิ่มลูกค้า", "ข้อมูลลูกค้า", "แก้ไขลูกค้า"]
+    },
+    "task": {
+        "keywords": ["งาน", "งน", "task", "work", "ทำงาน", "โปรเจค", "project"],
+        "actions": ["งานวันนี้", "งานใหม่", "เพิ่มงาน", "สถานะงาน"]
+    },
+    "sales": {
+        "keywords": ["ขาย", "ขย", "sale", "ยอดขาย", "เงิน", "รายได้", "กำไร"],
+        "actions": ["ยอดขาย", "สถิติขาย", "รายงานขาย"]
+    },
+    "employee": {
+        "keywords": ["พนักงาน", "คน", "ทีม", "staff", "employee", "hr"],
+        "actions": ["คนใหม่", "เพิ่มพนักงาน", "ข้อมูลพนักงาน"]
+    },
+    "inventory": {
+        "keywords": ["สินค้า", "สต็อก", "คลัง", "product", "inventory"],
+        "actions": ["เช็คสินค้า", "เพิ่มสินค้า", "สต็อกสินค้า"]
+    }
+}
+
+# Checked in this order; the first action with a matching word wins
+INTENT_ACTIONS = [
+    ("create", ["เพิ่ม", "สร้าง", "ใหม่", "add", "create"]),
+    ("read", ["ดู", "แสดง", "ข้อมูล", "รายการ", "list", "show"]),
+    ("update", ["แก้", "อัปเดต", "เปลี่ยน", "update", "edit"]),
+    ("delete", ["ลบ", "delete", "remove"]),
+]
+
+class IntentClassifier:
+    """Scores every table and action in a single regex pass over the text.
+
+    All keyword, action and action-word phrases are compiled into one trie
+    regex, wrapped in a lookahead so it reports the longest phrase starting
+    at every position, including ones overlapping an earlier match ("งานใหม่"
+    inside "ทำงานใหม่"). Shorter phrases contained in a match (e.g. "ขาย"
+    inside "ยอดขาย") are precomputed per phrase as a bitmask, so each phrase
+    still counts once when present, as with the old `in` checks. Scores depend only on the set of phrases found, so results
+    are memoized per bitmask.
+    """
+
+    MAX_MEMO = 4096
+
+    def __init__(self, tables: Dict[str, dict], actions: List[Tuple[str, List[str]]]):
+        self.tables = list(tables)
+        self.actions = [name for name, _ in actions]
+        # phrase -> [(kind, key, weight_or_rank)]
+        self._effects = defaultdict(list)
+        for table, spec in tables.items():
+            for kw in spec.get("keywords", []):
+                self._effects[kw.lower()].append(("table", table, KEYWORD_WEIGHT))
+            for act in spec.get("actions", []):
+                self._effects[act.lower()].append(("table", table, ACTION_WEIGHT))
+        for rank, (action, words) in enumerate(actions):
+            for word in words:
+                self._effects[word.lower()].append(("action", action, rank))
+
+        self._phrases = list(self._effects)
+        self._masks = {
+            p: sum(1 << i for i, q in enumerate(self._phrases) if q in p)
+            for p in self._phrases
+        }
+        source = trie_pattern(self._phrases)
+        self._regex = re.compile(f"(?=({source}))") if source else None
+        self._memo = {}
+
+    def analyze(self, user_text: str) -> dict:
+        found = 0
+        if self._regex:
+            masks = self._masks
+            # Zero-width matches: the longest phrase at each start position
+            for phrase in set(self._regex.findall(user_text.lower())):
+                found |= masks[phrase]
+
+        result = self._memo.get(found)
+        if result is None:
+            if len(self._memo) >= self.MAX_MEMO:
+                self._memo.clear()
+            result = self._memo[found] = self._score(found)
+        return dict(result)
+
+    def _score(self, found: int) -> dict:
+        scores = defaultdict(int)
+        action_rank = None
+        for i, phrase in enumerate(self._phrases):
+            if not found >> i & 1:
+                continue
+            for kind, key, value in self._effects[phrase]:
+                if kind == "table":
+                    scores[key] += value
+                elif action_rank is None or value < action_rank:
+                    action_rank = value
+
+        # Ties go to the table listed first
+        detected_table = None
+        confidence = 0
+        for table in self.tables:
+            if scores[table] > confidence:
+                confidence = scores[table]
+                detected_table = table
+
+        return {
+            "table": detected_table,
+            "action": self.actions[action_rank] if action_rank is not None else None,
+            "confidence": confidence,
+            "should_ask": confidence < 2  # Ask if confidence is low
+        }
+
+def _intent_tables() -> Dict[str, dict]:
+    tables = dict(INTENT_TABLES)
+    # INTENT_MAP_JSON='{"supplier": {"keywords": [...], "actions": [...]}}' adds or replaces tables
+    for table, spec in settings.INTENT_MAP.items():
+        if isinstance(spec, dict):
+            tables[table] = spec
+    return tables
+
+intent_classifier = IntentClassifier(_intent_tables(), INTENT_ACTIONS)
+
+def analyze_user_intent(user_text: str) -> dict:
+    """Analyze user intent and suggest appropriate table/action"""
+    return intent_classifier.analyze(user_text)
@@ -0,0 +1,166 @@
+# Registry of Lark operations commands
+# One descriptor per LarkOperationsHandler command: its English/Thai aliases,
+# parameters and help line. handle_lark_command, the pre-LLM fast path and
+# the help message all read from here.
+
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Tuple
+from .text_match import compile_phrases
+
+@dataclass(frozen=True)
+class LarkCommand:
+    method: str                    # LarkOperationsHandler method
+    group: Optional[str]           # help section; None keeps it out of the help list
+    aliases: Tuple[str, ...]       # first one is the name shown in help
+    description: str
+    required: Tuple[str, ...] = ()
+    optional: Tuple[str, ...] = ()
+    takes_params: bool = True
+    fast: bool = False             # read-only and safe to answer without the LLM
+
+    @property
+    def name(self) -> str:
+        return self.aliases[0]
+
+    @property
+    def needs_table(self) -> bool:
+        return "table_id" in self.required
+
+    @property
+    def shortcut(self) -> Optional[str]:
+        return next((a for a in self.aliases if a.startswith("/")), None)
+
+    def missing(self, params: Dict) -> List[str]:
+        return [name for name in self.required if params.get(name) in (None, "", [], {})]
+
+    async def invoke(self, handler, params: Dict = None) -> str:
+        method = getattr(handler, self.method)
+        return await (method(params or {}) if self.takes_params else method())
+
+# Help sections in display order
+GROUPS = {
+    "tables": "📊 **ตาราง (Tables)**",
+    "fields": "📝 **ฟิลด์ (Fields)**",
+    "records": "📋 **ข้อมูล (Records)**",
+    "users": "👥 **ผู้ใช้ (Users)**",
+    "messaging": "💬 **แชท (Messaging)**",
+    "documents": "📄 **เอกสาร (Documents)**",
+    "wiki": "📚 **Wiki**",
+}
+
+LARK_COMMANDS = [
+    # Tables
+    LarkCommand("list_tables", "tables", ("list tables", "/tables", "ดูตาราง", "ตารางทั้งหมด"),
+                "ดูรายการตาราง", takes_params=False, fast=True),
+    LarkCommand("create_table", "tables", ("create table", "สร้างตาราง"),
+                "สร้างตารางใหม่", required=("name",), optional=("view_name", "fields")),
+    LarkCommand("delete_table", "tables", ("delete table", "ลบตาราง"),
+                "ลบตาราง", required=("table_id",)),
+    LarkCommand("update_table", "tables", ("update table", "แก้ไขตาราง"),
+                "แก้ไขชื่อตาราง", required=("table_id", "name")),
+    # Fields
+    LarkCommand("list_fields", "fields", ("list fields", "/fields", "ดูฟิลด์"),
+                "ดูรายการฟิลด์", required=("table_id",), fast=True),
+    LarkCommand("create_field", "fields", ("create field", "สร้างฟิลด์"),
+                "สร้างฟิลด์ใหม่", required=("table_id", "field_name"), optional=("type", "ui_type", "property")),
+    LarkCommand("delete_field", "fields", ("delete field", "ลบฟิลด์"),
+                "ลบฟิลด์", required=("table_id", "field_id")),
+    LarkCommand("update_field", "fields", ("update field", "แก้ไขฟิลด์"),
+                "แก้ไขฟิลด์", required=("table_id", "field_id"),
+                optional=("field_name", "type", "ui_type", "property")),
+    # Records
+    LarkCommand("search_records", "records", ("search records", "/search", "ค้นหาข้อมูล", "ดูข้อมูล"),
+                "ค้นหาข้อมูล", required=("table_id",),
+                optional=("filter", "field_names", "sort", "limit"), fast=True),
+    LarkCommand("create_record", "records", ("create record", "สร้างข้อมูล"),
+                "เพิ่มข้อมูลใหม่", required=("table_id", "fields")),
+    LarkCommand("batch_create_records", "records", ("batch create", "สร้างหลายรายการ"),
+                "เพิ่มหลายรายการ", required=("table_id", "records"), optional=("run_id",)),
+    LarkCommand("update_record", "records", ("update record", "แก้ไขข้อมูล"),
+                "แก้ไขข้อมูล", required=("table_id", "record_id", "fields")),
+    LarkCommand("batch_update_records", "records", ("batch update", "แก้ไขหลายรายการ"),
+                "แก้ไขหลายรายการ", required=("table_id", "records")),
+    LarkCommand("delete_record", "records", ("delete record", "ลบข้อมูล"),
+                "ลบข้อมูล", required=("table_id", "record_id")),
+    LarkCommand("batch_delete_records", "records", ("batch delete", "ลบหลายรายการ"),
+                "ลบหลายรายการ", required=("table_id", "record_ids")),
+    # Contacts
+    LarkCommand("list_users", "users", ("list users", "/users", "ดูรายชื่อผู้ใช้"),
+                "ดูรายชื่อผู้ใช้", optional=("department_id", "limit"), fast=True),
+    LarkCommand("get_user_info", "users", ("get user", "ดูข้อมูลผู้ใช้"),
+                "ดูข้อมูลผู้ใช้", required=("user_id",)),
+    LarkCommand("list_departments", "users", ("list departments", "/departments", "ดูรายชื่อแผนก"),
+                "ดูรายชื่อแผนก", optional=("limit",), fast=True),
+    LarkCommand("get_department_info", "users", ("get department", "ดูแผนก"),
+                "ดูข้อมูลแผนก", required=("department_id",)),
+    # Messaging
+    LarkCommand("list_chats", "messaging", ("list chats", "/chats", "ดูแชท"),
+                "ดูรายการแชท", takes_params=False, fast=True),
+    LarkCommand("create_chat", "messaging", ("create chat", "สร้างแชท"),
+                "สร้างแชทกลุ่ม", required=("name",), optional=("description", "user_ids", "chat_type")),
+    LarkCommand("send_im_message", "messaging", ("send message", "ส่งข้อความ"),
+                "ส่งข้อความ", required=("receive_id", "content"), optional=("receive_id_type", "msg_type")),
+    LarkCommand("get_chat_members", "messaging", ("get chat members", "ดูสมาชิกแชท"),
+                "ดูสมาชิกแชท", required=("chat_id",)),
+    # Documents
+    LarkCommand("get_document", "documents", ("get document", "ดูเอกสาร"),
+                "ดูเอกสาร", required=("document_id",)),
+    LarkCommand("get_document_content", "documents", ("get document content", "ดูเนื้อหาเอกสาร"),
+                "ดูเนื้อหาเอกสาร", required=("document_id",)),
+    LarkCommand("update_document", "documents", ("update document", "แก้ไขเอกสาร"),
+                "แก้ไขเอกสาร", required=("document_id", "block_id", "update_data")),
+    # Wiki
+    LarkCommand("get_wiki_node", "wiki", ("get wiki", "ดู wiki"),
+                "ดูข้อมูล Wiki", required=("token",), optional=("obj_type",)),
+    # Help
+    LarkCommand("send_help_message", None, ("help", "/help", "คำสั่ง", "ช่วยเหลือ"),
+                "ดูคำสั่งทั้งหมด", takes_params=False, fast=True),
+]
+
+class CommandRegistry:
+    """All command aliases compiled into one trie regex.
+
+    The regex prefers the longest alias at a position, so "get document
+    content" wins over "get document" and "ดูข้อมูลผู้ใช้" over "ดูข้อมูล"
+    regardless of the order commands are declared in.
+    """
+
+    def __init__(self, commands: Iterable[LarkCommand]):
+        self.commands = list(commands)
+        self._by_alias: Dict[str, LarkCommand] = {}
+        self._by_method: Dict[str, LarkCommand] = {}
+        for command in self.commands:
+            self._by_method[command.method] = command
+            for alias in command.aliases:
+                if alias.lower() in self._by_alias:
+                    raise ValueError(f"Duplicate command alias: {alias}")
+                self._by_alias[alias.lower()] = command
+        self._regex = compile_phrases(self._by_alias)
+
+    def get(self, method: str) -> Optional[LarkCommand]:
+        return self._by_method.get(method)
+
+    def find(self, text: str) -> Optional[LarkCommand]:
+        """First command mentioned anywhere in the text"""
+        match = self._regex.search((text or "").lower()) if self._regex else None
+        return self._by_alias[match.group()] if match else None
+
+    def match_prefix(self, text: str) -> Optional[Tuple[LarkCommand, int]]:
+        """(command, end offset) when the lowercased text starts with an alias"""
+        match = self._regex.match(text) if self._regex else None
+        return (self._by_alias[match.group()], match.end()) if match else None
+
+    def help_text(self) -> str:
+        sections = ["🤖 **คำสั่ง Lark ที่ใช้ได้**"]
+        for group, title in GROUPS.items():
+            lines = [title]
+            for command in self.commands:
+                if command.group != group:
+                    continue
+                shortcut = f" (`{command.shortcut}`)" if command.shortcut else ""
+                lines.append(f"• `{command.name}`{shortcut} - {command.description}")
+            sections.append("\n".join(lines))
+        sections.append("พิมพ์คำสั่งเหล่านี้เพื่อใช้งาน Lark ครับ! 🚀")
+        return "\n\n".join(sections)
+
+lark_commands = CommandRegistry(LARK_COMMANDS)
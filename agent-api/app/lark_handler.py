@@ -3,96 +3,149 @@
 
 import asyncio
 import json
-from typing import Dict, List, Any, Optional
-import random
+from typing import AsyncIterator, Dict, List, Any, Optional
+import uuid
 import logging
+from .batch_writer import BatchWriter
+from .config import settings
+from .lark_commands import lark_commands
+from .mcp_client import mcp_manager
+from .mcp_guard import ErrorCode, error_code
+from .tool_cache import CachedToolClient, tool_base_name, tool_cache
 
 logger = logging.getLogger(__name__)
 
+# Replies per MCPError code; other codes get the generic "try again" message
+ERROR_REPLIES = {
+    ErrorCode.FIELD_NOT_FOUND: "❌ ไม่พบฟิลด์ที่ระบุ กรุณาตรวจสอบชื่อฟิลด์ใหม่ครับ 📝",
+    ErrorCode.TABLE_NOT_FOUND: "❌ ไม่พบตารางที่ระบุ กรุณาตรวจสอบ Table ID ครับ 📊",
+    ErrorCode.PERMISSION: "❌ ไม่มีสิทธิ์เข้าถึง กรุณาติดต่อ Admin ครับ 🔐",
+    ErrorCode.INVALID: "❌ ข้อมูลไม่ถูกต้อง กรุณาตรวจสอบรูปแบบข้อมูลครับ ✏️",
+    ErrorCode.RATE_LIMITED: "⏳ ระบบ Lark ไม่ว่างชั่วคราว กรุณารอสักครู่แล้วลองใหม่ครับ",
+    ErrorCode.TIMEOUT: "⏳ Lark ตอบสนองช้าเกินไป กรุณาลองใหม่อีกครั้งครับ 🔄",
+    ErrorCode.UNAVAILABLE: "⚠️ ไม่สามารถเชื่อมต่อ Lark ได้ในขณะนี้ กรุณาลองใหม่ภายหลังครับ",
+    ErrorCode.CIRCUIT_OPEN: "⚠️ ไม่สามารถเชื่อมต่อ Lark ได้ในขณะนี้ กรุณาลองใหม่ภายหลังครับ",
+}
+
+# Largest page each list/search API accepts
+PAGE_SIZES = {
+    "bitable_v1_appTable_list": 100,
+    "bitable_v1_appTableField_list": 100,
+    "bitable_v1_appTableRecord_search": 500,
+    "contact_v3_user_list": 50,
+    "contact_v3_department_list": 50,
+    "im_v1_chat_list": 100,
+    "im_v1_chatMembers_get": 100,
+}
+DEFAULT_PAGE_SIZE = 50
+
+# Lines shown in a Telegram list reply; the rest are only counted
+MAX_LIST_LINES = 50
+
+# Items fetched when a search or directory listing gives no "limit"
+DEFAULT_SEARCH_LIMIT = 10
+DEFAULT_LIST_LIMIT = 20
+
+async def paginate(client, tool_name: str, arguments: Dict, max_items: Optional[int] = None,
+                   page_size: Optional[int] = None, prefetch: bool = True) -> AsyncIterator[Dict]:
+    """Yield `items` from every page of a Lark list/search tool, following
+    `page_token` while `has_more` is set.
+
+    Only one page is held at a time. With `prefetch`, the next page is
+    requested as soon as the current one arrives, so its round trip overlaps
+    with whatever the caller does with the current items. Stops after
+    `max_items` items without fetching further pages.
+    """
+    size = page_size or PAGE_SIZES.get(tool_base_name(tool_name), DEFAULT_PAGE_SIZE)
+    remaining = max_items
+
+    def fetch(page_token: Optional[str]):
+        params = {k: v for k, v in (arguments.get("params") or {}).items() if k != "page_token"}
+        params["page_size"] = size if remaining is None else max(1, min(size, remaining))
+        if page_token:
+            params["page_token"] = page_token
+        return asyncio.ensure_future(client.call_tool(tool_name, {**arguments, "params": params}))
+
+    if remaining is not None and remaining <= 0:
+        return
+    pending = fetch(None)
+    try:
+        while pending is not None:
+            page = await pending
+            pending = None
+            items = page.get("items") or []
+            if remaining is not None:
+                items = items[:remaining]
+                remaining -= len(items)
+            page_token = page.get("page_token")
+            more = bool(page.get("has_more") and page_token and remaining != 0)
+
+            if more and prefetch:
+                pending = fetch(page_token)
+            for item in items:
+                yield item
+            if more and not prefetch:
+                pending = fetch(page_token)
+    finally:
+        if pending is not None and not pending.done():
+            pending.cancel()
+
+async def _numbered_list(items: AsyncIterator[Dict], header: str, line, empty: str) -> str:
+    """Render "header + 1. ... 2. ..." from an item stream, showing at most
+    MAX_LIST_LINES lines and counting the rest."""
+    text = header
+    count = 0
+    async for item in items:
+        count += 1
+        if count <= MAX_LIST_LINES:
+            text += f"{count}. {line(item)}\n"
+    if not count:
+        return empty
+    if count > MAX_LIST_LINES:
+        text += f"... และอีก {count - MAX_LIST_LINES} รายการ (ทั้งหมด {count})\n"
+    return text
+
 class LarkOperationsHandler:
     def __init__(self, mcp_client):
-        self.mcp = mcp_client
-        self.base_id = "SEkObxgDpaPZbss1T3RlHzamgac"  # Your base ID
+        # Schema/directory reads are served from the shared result cache
+        self.mcp = CachedToolClient(mcp_client, tool_cache)
+        self.base_id = settings.LARK_ALLOWED_BASE_ID or "SEkObxgDpaPZbss1T3RlHzamgac"  # Your base ID
         
+    def iter_items(self, tool_name: str, arguments: Dict, **kwargs) -> AsyncIterator[Dict]:
+        """Stream every item of a paginated tool through this handler's client"""
+        return paginate(self.mcp, tool_name, arguments, **kwargs)
+
+    def iter_records(self, table_id: str, filter: Dict = None, field_names: List[str] = None,
+                     sort: List[Dict] = None, max_items: Optional[int] = None) -> AsyncIterator[Dict]:
+        """All records of a table matching `filter`, fetched page by page"""
+        data = {"field_names": field_names or [], "sort": sort or []}
+        if filter:
+            data["filter"] = filter
+        return self.iter_items("mcp__lark-tenant__bitable_v1_appTableRecord_search", {
+            "data": data,
+            "path": {"app_token": self.base_id, "table_id": table_id},
+            "useUAT": False
+        }, max_items=max_items)
+
+    def batch_writer(self, **kwargs) -> BatchWriter:
+        """Chunked writer for this base, going through the cache-invalidating client"""
+        return BatchWriter(self.mcp, self.base_id, **kwargs)
+
     async def handle_lark_command(self, chat_id: int, command: str, params: Dict = None) -> str:
         """Route Lark commands to appropriate handlers"""
         try:
-            command_lower = command.lower()
-            
-            # Table Operations
-            if "create table" in command_lower or "สร้างตาราง" in command_lower:
-                return await self.create_table(params or {})
-            elif "list tables" in command_lower or "ดูตาราง" in command_lower:
-                return await self.list_tables()
-            elif "delete table" in command_lower or "ลบตาราง" in command_lower:
-                return await self.delete_table(params or {})
-            elif "update table" in command_lower or "แก้ไขตาราง" in command_lower:
-                return await self.update_table(params or {})
-                
-            # Field Operations
-            elif "create field" in command_lower or "สร้างฟิลด์" in command_lower:
-                return await self.create_field(params or {})
-            elif "list fields" in command_lower or "ดูฟิลด์" in command_lower:
-                return await self.list_fields(params or {})
-            elif "delete field" in command_lower or "ลบฟิลด์" in command_lower:
-                return await self.delete_field(params or {})
-            elif "update field" in command_lower or "แก้ไขฟิลด์" in command_lower:
-                return await self.update_field(params or {})
-                
-            # Record Operations
-            elif "create record" in command_lower or "สร้างข้อมูล" in command_lower:
-                return await self.create_record(params or {})
-            elif "batch create" in command_lower or "สร้างหลายรายการ" in command_lower:
-                return await self.batch_create_records(params or {})
-            elif "update record" in command_lower or "แก้ไขข้อมูล" in command_lower:
-                return await self.update_record(params or {})
-            elif "batch update" in command_lower or "แก้ไขหลายรายการ" in command_lower:
-                return await self.batch_update_records(params or {})
-            elif "delete record" in command_lower or "ลบข้อมูล" in command_lower:
-                return await self.delete_record(params or {})
-            elif "batch delete" in command_lower or "ลบหลายรายการ" in command_lower:
-                return await self.batch_delete_records(params or {})
-            elif "search records" in command_lower or "ค้นหาข้อมูล" in command_lower:
-                return await self.search_records(params or {})
-                
-            # Contact Operations
-            elif "get user" in command_lower or "ดูข้อมูลผู้ใช้" in command_lower:
-                return await self.get_user_info(params or {})
-            elif "list users" in command_lower or "ดูรายชื่อผู้ใช้" in command_lower:
-                return await self.list_users(params or {})
-            elif "get department" in command_lower or "ดูแผนก" in command_lower:
-                return await self.get_department_info(params or {})
-            elif "list departments" in command_lower or "ดูรายชื่อแผนก" in command_lower:
-                return await self.list_departments(params or {})
-                
-            # Document Operations
-            elif "get document" in command_lower or "ดูเอกสาร" in command_lower:
-                return await self.get_document(params or {})
-            elif "update document" in command_lower or "แก้ไขเอกสาร" in command_lower:
-                return await self.update_document(params or {})
-            elif "get document content" in command_lower or "ดูเนื้อหาเอกสาร" in command_lower:
-                return await self.get_document_content(params or {})
-                
-            # Messaging Operations
-            elif "create chat" in command_lower or "สร้างแชท" in command_lower:
-                return await self.create_chat(params or {})
-            elif "list chats" in command_lower or "ดูแชท" in command_lower:
-                return await self.list_chats()
-            elif "send message" in command_lower or "ส่งข้อความ" in command_lower:
-                return await self.send_im_message(params or {})
-            elif "get chat members" in command_lower or "ดูสมาชิกแชท" in command_lower:
-                return await self.get_chat_members(params or {})
-                
-            # Wiki Operations
-            elif "get wiki" in command_lower or "ดู wiki" in command_lower:
-                return await self.get_wiki_node(params or {})
-                
-            else:
+            spec = lark_commands.find(command)
+            if spec is None:
                 return await self.send_help_message()
+            params = params or {}
+            missing = spec.missing(params)
+            if missing:
+                return f"⚠️ คำสั่ง `{spec.name}` ต้องระบุ: {', '.join(missing)} ครับ"
+            return await spec.invoke(self, params)
                 
         except Exception as e:
             logger.error(f"Lark command error: {e}")
-            return await self.handle_operation_error(str(e), command)
+            return await self.handle_operation_error(e, command)
 
     # === TABLE OPERATIONS ===
     async def create_table(self, params: Dict) -> str:
@@ -111,28 +164,23 @@ class LarkOperationsHandler:
             })
             return f"✅ สร้างตาราง '{params.get('name')}' เรียบร้อยแล้วครับ 📊"
         except Exception as e:
-            return await self.handle_operation_error(str(e), "create_table")
+            return await self.handle_operation_error(e, "create_table")
 
     async def list_tables(self) -> str:
         """List all tables in the base"""
         try:
-            result = await self.mcp.call_tool("mcp__lark-tenant__bitable_v1_appTable_list", {
-                "params": {"page_size": 50},
+            tables = self.iter_items("mcp__lark-tenant__bitable_v1_appTable_list", {
                 "path": {"app_token": self.base_id},
                 "useUAT": False
             })
-            
-            tables = result.get("items", [])
-            if not tables:
-                return "ไม่พบตารางในฐานข้อมูล ครับ 📋"
-            
-            table_list = "📊 **รายการตาราง**\n\n"
-            for i, table in enumerate(tables, 1):
-                table_list += f"{i}. {table['name']} (ID: {table['table_id']})\n"
-            
-            return table_list
+            return await _numbered_list(
+                tables,
+                "📊 **รายการตาราง**\n\n",
+                lambda table: f"{table['name']} (ID: {table['table_id']})",
+                "ไม่พบตารางในฐานข้อมูล ครับ 📋",
+            )
         except Exception as e:
-            return await self.handle_operation_error(str(e), "list_tables")
+            return await self.handle_operation_error(e, "list_tables")
 
     async def delete_table(self, params: Dict) -> str:
         """Delete a table"""
@@ -144,7 +192,7 @@ class LarkOperationsHandler:
             })
             return f"✅ ลบตารางเรียบร้อยแล้วครับ 🗑️"
         except Exception as e:
-            return await self.handle_operation_error(str(e), "delete_table")
+            return await self.handle_operation_error(e, "delete_table")
 
     async def update_table(self, params: Dict) -> str:
         """Update table name"""
@@ -158,7 +206,7 @@ class LarkOperationsHandler:
             })
             return f"✅ แก้ไขชื่อตารางเป็น '{new_name}' เรียบร้อยแล้วครับ ✏️"
         except Exception as e:
-            return await self.handle_operation_error(str(e), "update_table")
+            return await self.handle_operation_error(e, "update_table")
 
     # === FIELD OPERATIONS ===
     async def create_field(self, params: Dict) -> str:
@@ -171,34 +219,29 @@ class LarkOperationsHandler:
                     "ui_type": params.get("ui_type", "Text"),
                     "property": params.get("property", {})
                 },
-                "params": {"client_token": f"field_{random.randint(1000, 9999)}"},
+                "params": {"client_token": str(uuid.uuid4())},
                 "path": {"app_token": self.base_id, "table_id": params.get("table_id")},
                 "useUAT": False
             })
             return f"✅ สร้างฟิลด์ '{params.get('field_name')}' เรียบร้อยแล้วครับ 📝"
         except Exception as e:
-            return await self.handle_operation_error(str(e), "create_field")
+            return await self.handle_operation_error(e, "create_field")
 
     async def list_fields(self, params: Dict) -> str:
         """List all fields in a table"""
         try:
-            result = await self.mcp.call_tool("mcp__lark-tenant__bitable_v1_appTableField_list", {
-                "params": {"page_size": 50},
+            fields = self.iter_items("mcp__lark-tenant__bitable_v1_appTableField_list", {
                 "path": {"app_token": self.base_id, "table_id": params.get("table_id")},
                 "useUAT": False
             })
-            
-            fields = result.get("items", [])
-            if not fields:
-                return "ไม่พบฟิลด์ในตารางนี้ ครับ 📝"
-            
-            field_list = f"📝 **รายการฟิลด์**\n\n"
-            for i, field in enumerate(fields, 1):
-                field_list += f"{i}. {field['field_name']} ({field['ui_type']})\n"
-            
-            return field_list
+            return await _numbered_list(
+                fields,
+                "📝 **รายการฟิลด์**\n\n",
+                lambda field: f"{field['field_name']} ({field['ui_type']})",
+                "ไม่พบฟิลด์ในตารางนี้ ครับ 📝",
+            )
         except Exception as e:
-            return await self.handle_operation_error(str(e), "list_fields")
+            return await self.handle_operation_error(e, "list_fields")
 
     async def delete_field(self, params: Dict) -> str:
         """Delete a field"""
@@ -213,7 +256,7 @@ class LarkOperationsHandler:
             })
             return f"✅ ลบฟิลด์เรียบร้อยแล้วครับ 🗑️"
         except Exception as e:
-            return await self.handle_operation_error(str(e), "delete_field")
+            return await self.handle_operation_error(e, "delete_field")
 
     async def update_field(self, params: Dict) -> str:
         """Update a field"""
@@ -234,7 +277,7 @@ class LarkOperationsHandler:
             })
             return f"✅ แก้ไขฟิลด์เรียบร้อยแล้วครับ ✏️"
         except Exception as e:
-            return await self.handle_operation_error(str(e), "update_field")
+            return await self.handle_operation_error(e, "update_field")
 
     # === RECORD OPERATIONS ===
     async def create_record(self, params: Dict) -> str:
@@ -243,7 +286,7 @@ class LarkOperationsHandler:
             result = await self.mcp.call_tool("mcp__lark-tenant__bitable_v1_appTableRecord_create", {
                 "data": {"fields": params.get("fields", {})},
                 "params": {
-                    "client_token": f"record_{random.randint(1000, 9999)}",
+                    "client_token": str(uuid.uuid4()),
                     "user_id_type": "open_id"
                 },
                 "path": {"app_token": self.base_id, "table_id": params.get("table_id")},
@@ -251,24 +294,20 @@ class LarkOperationsHandler:
             })
             return f"✅ เพิ่มข้อมูลใหม่เรียบร้อยแล้วครับ 📝"
         except Exception as e:
-            return await self.handle_operation_error(str(e), "create_record")
+            return await self.handle_operation_error(e, "create_record")
 
     async def batch_create_records(self, params: Dict) -> str:
         """Create multiple records at once"""
         try:
-            records = params.get("records", [])
-            result = await self.mcp.call_tool("mcp__lark-tenant__bitable_v1_appTableRecord_batchCreate", {
-                "data": {"records": records},
-                "params": {
-                    "client_token": f"batch_{random.randint(1000, 9999)}",
-                    "user_id_type": "open_id"
-                },
-                "path": {"app_token": self.base_id, "table_id": params.get("table_id")},
-                "useUAT": False
-            })
-            return f"✅ เพิ่มข้อมูล {len(records)} รายการเรียบร้อยแล้วครับ 📊"
+            # A fresh run_id per call: repeating the same rows later is a new
+            # write; pass the earlier run_id only to resume an interrupted one
+            run_id = params.get("run_id") or str(uuid.uuid4())
+            report = await self.batch_writer().run(
+                "create", params.get("table_id"), params.get("records", []), run_id=run_id
+            )
+            return report.summary()
         except Exception as e:
-            return await self.handle_operation_error(str(e), "batch_create")
+            return await self.handle_operation_error(e, "batch_create")
 
     async def update_record(self, params: Dict) -> str:
         """Update a single record"""
@@ -285,21 +324,15 @@ class LarkOperationsHandler:
             })
             return f"✅ แก้ไขข้อมูลเรียบร้อยแล้วครับ ✏️"
         except Exception as e:
-            return await self.handle_operation_error(str(e), "update_record")
+            return await self.handle_operation_error(e, "update_record")
 
     async def batch_update_records(self, params: Dict) -> str:
         """Update multiple records at once"""
         try:
-            records = params.get("records", [])
-            result = await self.mcp.call_tool("mcp__lark-tenant__bitable_v1_appTableRecord_batchUpdate", {
-                "data": {"records": records},
-                "params": {"user_id_type": "open_id"},
-                "path": {"app_token": self.base_id, "table_id": params.get("table_id")},
-                "useUAT": False
-            })
-            return f"✅ แก้ไขข้อมูล {len(records)} รายการเรียบร้อยแล้วครับ 🔄"
+            report = await self.batch_writer().run("update", params.get("table_id"), params.get("records", []))
+            return report.summary()
         except Exception as e:
-            return await self.handle_operation_error(str(e), "batch_update")
+            return await self.handle_operation_error(e, "batch_update")
 
     async def delete_record(self, params: Dict) -> str:
         """Delete a single record"""
@@ -314,42 +347,40 @@ class LarkOperationsHandler:
             })
             return f"✅ ลบข้อมูลเรียบร้อยแล้วครับ 🗑️"
         except Exception as e:
-            return await self.handle_operation_error(str(e), "delete_record")
+            return await self.handle_operation_error(e, "delete_record")
 
     async def batch_delete_records(self, params: Dict) -> str:
         """Delete multiple records at once"""
         try:
-            record_ids = params.get("record_ids", [])
-            result = await self.mcp.call_tool("mcp__lark-tenant__bitable_v1_appTableRecord_batchDelete", {
-                "data": {"records": record_ids},
-                "path": {"app_token": self.base_id, "table_id": params.get("table_id")},
-                "useUAT": False
-            })
-            return f"✅ ลบข้อมูล {len(record_ids)} รายการเรียบร้อยแล้วครับ 🗑️"
+            report = await self.batch_writer().run("delete", params.get("table_id"), params.get("record_ids", []))
+            return report.summary()
         except Exception as e:
-            return await self.handle_operation_error(str(e), "batch_delete")
+            return await self.handle_operation_error(e, "batch_delete")
 
     async def search_records(self, params: Dict) -> str:
         """Search records with filters"""
         try:
-            result = await self.mcp.call_tool("mcp__lark-tenant__bitable_v1_appTableRecord_search", {
-                "data": {
-                    "field_names": params.get("field_names", []),
-                    "filter": params.get("filter"),
-                    "sort": params.get("sort", [])
-                },
-                "params": {"page_size": params.get("limit", 10)},
-                "path": {"app_token": self.base_id, "table_id": params.get("table_id")},
-                "useUAT": False
-            })
-            
-            records = result.get("items", [])
+            limit = params.get("limit") or DEFAULT_SEARCH_LIMIT
+            # One record past the limit tells us whether there are more,
+            # without paging through the rest of the table
+            records = [record async for record in self.iter_records(
+                params.get("table_id"),
+                filter=params.get("filter"),
+                field_names=params.get("field_names"),
+                sort=params.get("sort"),
+                max_items=limit + 1,
+            )]
             if not records:
                 return "ไม่พบข้อมูลที่ตรงกับเงื่อนไข ครับ 🔍"
-            
-            return f"🔍 พบข้อมูล {len(records)} รายการ\n\n{self.format_records(records)}"
+
+            if len(records) > limit:
+                records = records[:limit]
+                header = f"🔍 พบข้อมูลมากกว่า {limit} รายการ (แสดง {limit} รายการแรก)"
+            else:
+                header = f"🔍 พบข้อมูล {len(records)} รายการ"
+            return f"{header}\n\n{self.format_records(records)}"
         except Exception as e:
-            return await self.handle_operation_error(str(e), "search_records")
+            return await self.handle_operation_error(e, "search_records")
 
     # === CONTACT OPERATIONS ===
     async def get_user_info(self, params: Dict) -> str:
@@ -367,33 +398,26 @@ class LarkOperationsHandler:
             
             return f"👤 **ข้อมูลผู้ใช้**\n\n📛 ชื่อ: {name}\n📧 อีเมล: {email}"
         except Exception as e:
-            return await self.handle_operation_error(str(e), "get_user")
+            return await self.handle_operation_error(e, "get_user")
 
     async def list_users(self, params: Dict) -> str:
         """List users in department"""
         try:
-            result = await self.mcp.call_tool("mcp__lark-tenant__contact_v3_user_list", {
+            users = self.iter_items("mcp__lark-tenant__contact_v3_user_list", {
                 "params": {
                     "user_id_type": "open_id",
-                    "department_id": params.get("department_id"),
-                    "page_size": params.get("limit", 20)
+                    "department_id": params.get("department_id")
                 },
                 "useUAT": False
-            })
-            
-            users = result.get("items", [])
-            if not users:
-                return "ไม่พบผู้ใช้ในแผนกนี้ ครับ 👥"
-            
-            user_list = "👥 **รายชื่อผู้ใช้**\n\n"
-            for i, user in enumerate(users, 1):
-                name = user.get("name", "ไม่ระบุ")
-                email = user.get("enterprise_email", "ไม่ระบุ")
-                user_list += f"{i}. {name} ({email})\n"
-            
-            return user_list
+            }, max_items=params.get("limit") or DEFAULT_LIST_LIMIT)
+            return await _numbered_list(
+                users,
+                "👥 **รายชื่อผู้ใช้**\n\n",
+                lambda user: f"{user.get('name', 'ไม่ระบุ')} ({user.get('enterprise_email', 'ไม่ระบุ')})",
+                "ไม่พบผู้ใช้ในแผนกนี้ ครับ 👥",
+            )
         except Exception as e:
-            return await self.handle_operation_error(str(e), "list_users")
+            return await self.handle_operation_error(e, "list_users")
 
     async def get_department_info(self, params: Dict) -> str:
         """Get department information"""
@@ -410,32 +434,23 @@ class LarkOperationsHandler:
             
             return f"🏢 **ข้อมูลแผนก**\n\n📛 ชื่อแผนก: {name}\n👥 จำนวนสมาชิก: {member_count} คน"
         except Exception as e:
-            return await self.handle_operation_error(str(e), "get_department")
+            return await self.handle_operation_error(e, "get_department")
 
     async def list_departments(self, params: Dict) -> str:
         """List departments"""
         try:
-            result = await self.mcp.call_tool("mcp__lark-tenant__contact_v3_department_list", {
-                "params": {
-                    "department_id_type": "open_department_id",
-                    "page_size": params.get("limit", 20)
-                },
+            departments = self.iter_items("mcp__lark-tenant__contact_v3_department_list", {
+                "params": {"department_id_type": "open_department_id"},
                 "useUAT": False
-            })
-            
-            departments = result.get("items", [])
-            if not departments:
-                return "ไม่พบแผนก ครับ 🏢"
-            
-            dept_list = "🏢 **รายชื่อแผนก**\n\n"
-            for i, dept in enumerate(departments, 1):
-                name = dept.get("name", "ไม่ระบุ")
-                member_count = dept.get("member_count", 0)
-                dept_list += f"{i}. {name} ({member_count} คน)\n"
-            
-            return dept_list
+            }, max_items=params.get("limit") or DEFAULT_LIST_LIMIT)
+            return await _numbered_list(
+                departments,
+                "🏢 **รายชื่อแผนก**\n\n",
+                lambda dept: f"{dept.get('name', 'ไม่ระบุ')} ({dept.get('member_count', 0)} คน)",
+                "ไม่พบแผนก ครับ 🏢",
+            )
         except Exception as e:
-            return await self.handle_operation_error(str(e), "list_departments")
+            return await self.handle_operation_error(e, "list_departments")
 
     # === DOCUMENT OPERATIONS ===
     async def get_document(self, params: Dict) -> str:
@@ -453,7 +468,7 @@ class LarkOperationsHandler:
             
             return f"📄 **เอกสาร**\n\nพบ {len(blocks)} บล็อกข้อมูล"
         except Exception as e:
-            return await self.handle_operation_error(str(e), "get_document")
+            return await self.handle_operation_error(e, "get_document")
 
     async def get_document_content(self, params: Dict) -> str:
         """Get document raw content"""
@@ -474,14 +489,14 @@ class LarkOperationsHandler:
             
             return f"📄 **เนื้อหาเอกสาร**\n\n{content}"
         except Exception as e:
-            return await self.handle_operation_error(str(e), "get_document_content")
+            return await self.handle_operation_error(e, "get_document_content")
 
     async def update_document(self, params: Dict) -> str:
         """Update document block"""
         try:
             result = await self.mcp.call_tool("mcp__lark-tenant__docx_v1_documentBlock_patch", {
                 "data": params.get("update_data", {}),
-                "params": {"client_token": f"doc_{random.randint(1000, 9999)}"},
+                "params": {"client_token": str(uuid.uuid4())},
                 "path": {
                     "document_id": params.get("document_id"),
                     "block_id": params.get("block_id")
@@ -490,7 +505,7 @@ class LarkOperationsHandler:
             })
             return f"✅ แก้ไขเอกสารเรียบร้อยแล้วครับ 📝"
         except Exception as e:
-            return await self.handle_operation_error(str(e), "update_document")
+            return await self.handle_operation_error(e, "update_document")
 
     # === MESSAGING OPERATIONS ===
     async def create_chat(self, params: Dict) -> str:
@@ -508,29 +523,23 @@ class LarkOperationsHandler:
             })
             return f"✅ สร้างแชทกลุ่ม '{params.get('name')}' เรียบร้อยแล้วครับ 💬"
         except Exception as e:
-            return await self.handle_operation_error(str(e), "create_chat")
+            return await self.handle_operation_error(e, "create_chat")
 
     async def list_chats(self) -> str:
         """List user's chats"""
         try:
-            result = await self.mcp.call_tool("mcp__lark-tenant__im_v1_chat_list", {
-                "params": {"page_size": 20, "user_id_type": "open_id"},
+            chats = self.iter_items("mcp__lark-tenant__im_v1_chat_list", {
+                "params": {"user_id_type": "open_id"},
                 "useUAT": False
             })
-            
-            chats = result.get("items", [])
-            if not chats:
-                return "ไม่พบแชทกลุ่ม ครับ 💬"
-            
-            chat_list = "💬 **รายการแชท**\n\n"
-            for i, chat in enumerate(chats, 1):
-                name = chat.get("name", "ไม่มีชื่อ")
-                member_count = chat.get("member_count", 0)
-                chat_list += f"{i}. {name} ({member_count} คน)\n"
-            
-            return chat_list
+            return await _numbered_list(
+                chats,
+                "💬 **รายการแชท**\n\n",
+                lambda chat: f"{chat.get('name', 'ไม่มีชื่อ')} ({chat.get('member_count', 0)} คน)",
+                "ไม่พบแชทกลุ่ม ครับ 💬",
+            )
         except Exception as e:
-            return await self.handle_operation_error(str(e), "list_chats")
+            return await self.handle_operation_error(e, "list_chats")
 
     async def send_im_message(self, params: Dict) -> str:
         """Send message to Lark chat"""
@@ -546,29 +555,24 @@ class LarkOperationsHandler:
             })
             return f"✅ ส่งข้อความเรียบร้อยแล้วครับ 📤"
         except Exception as e:
-            return await self.handle_operation_error(str(e), "send_message")
+            return await self.handle_operation_error(e, "send_message")
 
     async def get_chat_members(self, params: Dict) -> str:
         """Get chat members"""
         try:
-            result = await self.mcp.call_tool("mcp__lark-tenant__im_v1_chatMembers_get", {
-                "params": {"member_id_type": "open_id", "page_size": 50},
+            members = self.iter_items("mcp__lark-tenant__im_v1_chatMembers_get", {
+                "params": {"member_id_type": "open_id"},
                 "path": {"chat_id": params.get("chat_id")},
                 "useUAT": False
             })
-            
-            members = result.get("items", [])
-            if not members:
-                return "ไม่พบสมาชิกในแชทนี้ ครับ 👥"
-            
-            member_list = "👥 **สมาชิกแชท**\n\n"
-            for i, member in enumerate(members, 1):
-                name = member.get("name", "ไม่ระบุ")
-                member_list += f"{i}. {name}\n"
-            
-            return member_list
+            return await _numbered_list(
+                members,
+                "👥 **สมาชิกแชท**\n\n",
+                lambda member: member.get("name", "ไม่ระบุ"),
+                "ไม่พบสมาชิกในแชทนี้ ครับ 👥",
+            )
         except Exception as e:
-            return await self.handle_operation_error(str(e), "get_chat_members")
+            return await self.handle_operation_error(e, "get_chat_members")
 
     # === WIKI OPERATIONS ===
     async def get_wiki_node(self, params: Dict) -> str:
@@ -587,13 +591,13 @@ class LarkOperationsHandler:
             
             return f"📚 **Wiki Node**\n\n📛 ชื่อ: {title}"
         except Exception as e:
-            return await self.handle_operation_error(str(e), "get_wiki")
+            return await self.handle_operation_error(e, "get_wiki")
 
     # === UTILITY FUNCTIONS ===
     def format_records(self, records: List[Dict]) -> str:
         """Format records for display"""
         formatted = ""
-        for i, record in enumerate(records[:5], 1):  # Show max 5 records
+        for i, record in enumerate(records, 1):
             formatted += f"{i}. "
             fields = record.get("fields", {})
             for field_name, value in list(fields.items())[:3]:  # Show max 3 fields
@@ -608,67 +612,13 @@ class LarkOperationsHandler:
             formatted = formatted.rstrip(" | ") + "\n"
         return formatted
 
-    async def handle_operation_error(self, error_msg: str, operation: str) -> str:
+    async def handle_operation_error(self, error: Exception, operation: str) -> str:
         """Handle errors with natural Thai responses"""
-        error_lower = error_msg.lower()
-        
-        if "fieldnamenotfound" in error_lower:
-            return f"❌ ไม่พบฟิลด์ที่ระบุ กรุณาตรวจสอบชื่อฟิลด์ใหม่ครับ 📝"
-        elif "tablenotfound" in error_lower:
-            return f"❌ ไม่พบตารางที่ระบุ กรุณาตรวจสอบ Table ID ครับ 📊"
-        elif "permission" in error_lower or "access" in error_lower:
-            return f"❌ ไม่มีสิทธิ์เข้าถึง กรุณาติดต่อ Admin ครับ 🔐"
-        elif "validation" in error_lower:
-            return f"❌ ข้อมูลไม่ถูกต้อง กรุณาตรวจสอบรูปแบบข้อมูลครับ ✏️"
-        else:
-            return f"❌ เกิดข้อผิดพลาดในการ{operation} ลองใหม่อีกครั้งครับ 🔄"
+        reply = ERROR_REPLIES.get(error_code(error))
+        return reply or f"❌ เกิดข้อผิดพลาดในการ{operation} ลองใหม่อีกครั้งครับ 🔄"
 
     async def send_help_message(self) -> str:
         """Send help message with all available commands"""
-        help_text = """
-🤖 **คำสั่ง Lark ที่ใช้ได้**
-
-📊 **ตาราง (Tables)**
-• `list tables` - ดูรายการตาราง
-• `create table` - สร้างตารางใหม่
-• `delete table` - ลบตาราง
-• `update table` - แก้ไขชื่อตาราง
-
-📝 **ฟิลด์ (Fields)**
-• `list fields` - ดูรายการฟิลด์
-• `create field` - สร้างฟิลด์ใหม่
-• `delete field` - ลบฟิลด์
-• `update field` - แก้ไขฟิลด์
-
-📋 **ข้อมูล (Records)**
-• `search records` - ค้นหาข้อมูล
-• `create record` - เพิ่มข้อมูลใหม่
-• `batch create` - เพิ่มหลายรายการ
-• `update record` - แก้ไขข้อมูล
-• `batch update` - แก้ไขหลายรายการ
-• `delete record` - ลบข้อมูล
-• `batch delete` - ลบหลายรายการ
-
-👥 **ผู้ใช้ (Users)**
-• `list users` - ดูรายชื่อผู้ใช้
-• `get user` - ดูข้อมูลผู้ใช้
-• `list departments` - ดูรายชื่อแผนก
-• `get department` - ดูข้อมูลแผนก
-
-💬 **แชท (Messaging)**
-• `list chats` - ดูรายการแชท
-• `create chat` - สร้างแชทกลุ่ม
-• `send message` - ส่งข้อความ
-• `get chat members` - ดูสมาชิกแชท
-
-📄 **เอกสาร (Documents)**
-• `get document` - ดูเอกสาร
-• `get document content` - ดูเนื้อหาเอกสาร
-• `update document` - แก้ไขเอกสาร
-
-📚 **Wiki**
-• `get wiki` - ดูข้อมูล Wiki
-
-พิมพ์คำสั่งเหล่านี้เพื่อใช้งาน Lark ครับ! 🚀
-"""
-        return help_text
+        return lark_commands.help_text()
+
+lark_handler = LarkOperationsHandler(mcp_manager)
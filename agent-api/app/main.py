@@ -1,18 +1,58 @@
 from fastapi import FastAPI, HTTPException, BackgroundTasks
 from fastapi.responses import JSONResponse
 from pydantic import BaseModel
+from contextlib import asynccontextmanager
 import asyncio
 import json
 from .config import settings
-from .agent import run_task_with_greeting  # Use the new function with greeting
-from .mcp_client import get_mcp_tools
+from .agent import run_task_with_greeting, run_task_with_greeting_streaming  # Use the new function with greeting
+from .mcp_client import get_mcp_tools, mcp_manager
+from .staff_directory import staff_directory
+from .usage import usage_tracker
+from .tool_cache import tool_cache
+from .mcp_guard import tool_guard
+from .rate_limit import rate_limiter
+from .command_router import command_router
+from .importer import SUPPORTED_EXTENSIONS, table_importer
+from .table_helper import resolve_table
+from .normalizer import normalize_user_text
+from .memory import chat_memory
+from .telegram_client import telegram_client, ProgressiveMessage
+from .dispatcher import ChatDispatcher
+from .dedup import build_deduplicator
+from .telegram_polling import TelegramPoller
 import logging
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-app = FastAPI(title="Lark MCP Agent API", version="6.2")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Open the shared MCP session once; requests reuse its tools
+    await mcp_manager.start()
+    await staff_directory.start()
+    await chat_memory.start()
+    await telegram_client.start()
+    await dispatcher.start()
+    if settings.TG_INGEST_MODE == "polling":
+        await poller.start()
+    try:
+        yield
+    finally:
+        await poller.stop()
+        await dispatcher.stop()
+        await deduplicator.close()
+        await telegram_client.close()
+        await chat_memory.stop()
+        await staff_directory.stop()
+        await mcp_manager.stop()
+
+deduplicator = build_deduplicator()
+
+app = FastAPI(title="Lark MCP Agent API", version="6.2", lifespan=lifespan)
+
+BUSY_MESSAGE = "ขณะนี้มีคำขอจำนวนมาก กรุณาส่งใหม่อีกครั้งในอีกสักครู่ครับ 🙏"
 
 class AgentRequest(BaseModel):
     prompt: str
@@ -24,7 +64,17 @@ class TelegramUpdate(BaseModel):
 
 @app.get("/health")
 async def health_check():
-    return {"status": "ok", "message": "Agent API is running"}
+    return {
+        "status": "ok",
+        "message": "Agent API is running",
+        "ingest_mode": settings.TG_INGEST_MODE,
+        "queue": dispatcher.stats(),
+        "dedup": deduplicator.stats(),
+        "polling": poller.stats(),
+        "memory": chat_memory.stats(),
+        "fast_path": command_router.stats(),
+        "telegram": telegram_client.stats()
+    }
 
 @app.get("/mcp/health")
 async def mcp_health():
@@ -33,6 +83,11 @@ async def mcp_health():
         return {
             "status": "ok", 
             "tool_count": len(tools),
+            "session": mcp_manager.stats(),
+            "staff_directory": staff_directory.stats(),
+            "result_cache": tool_cache.stats(),
+            "calls": tool_guard.stats(),
+            "rate_limits": rate_limiter.stats(),
             "base_lock": settings.BASE_LOCK,
             "allowed_base_id": settings.LARK_ALLOWED_BASE_ID,
             "table_count": len(settings.TABLE_MAP)
@@ -44,6 +99,7 @@ async def mcp_health():
             content={
                 "status": "error", 
                 "message": str(e),
+                "session": mcp_manager.stats(),
                 "mcp_config": {
                     "mode": settings.MCP_MODE,
                     "base_url": settings.LARK_MCP_BASE_URL,
@@ -53,6 +109,11 @@ async def mcp_health():
             }
         )
 
+@app.get("/agent/usage")
+async def agent_usage():
+    """Token totals and prompt-cache hits across model calls"""
+    return usage_tracker.stats()
+
 @app.get("/mcp/config")
 async def mcp_config():
     return {
@@ -78,25 +139,50 @@ async def run_agent(request: AgentRequest):
 async def telegram_webhook(update: TelegramUpdate, background_tasks: BackgroundTasks):
     """Handle Telegram webhook updates"""
     try:
-        if not update.message:
-            return {"status": "ok"}
-        
-        chat_id = update.message.get("chat", {}).get("id")
-        text = update.message.get("text", "")
-        
-        if not text or not chat_id:
-            return {"status": "ok"}
-        
-        # Process in background with chat_id
-        background_tasks.add_task(process_telegram_message, chat_id, text)
-        
+        await ingest_update(update.model_dump(), background_tasks)
         return {"status": "ok"}
     except Exception as e:
         logger.error(f"Telegram webhook error: {e}")
         return {"status": "error", "message": str(e)}
 
-async def process_telegram_message(chat_id: int, text: str):
+async def ingest_update(update: dict, background_tasks: BackgroundTasks = None):
+    """Shared entry for webhook and polling updates: dedup, then queue for processing"""
+    # Telegram retries slow deliveries with the same update_id
+    if await deduplicator.is_duplicate(update.get("update_id")):
+        return
+
+    message = update.get("message") or {}
+    chat_id = message.get("chat", {}).get("id")
+    text = message.get("text", "")
+    document = message.get("document")
+
+    if not chat_id or not (text or document):
+        return
+
+    # Queue for the worker pool; per-chat order is preserved
+    submitted = (
+        dispatcher.submit(chat_id, message.get("caption", ""), _document_job(message))
+        if document else dispatcher.submit(chat_id, text)
+    )
+    if not submitted:
+        logger.warning(f"Dispatch queue full, rejecting message from chat {chat_id}")
+        if background_tasks:
+            background_tasks.add_task(send_telegram_message, chat_id, BUSY_MESSAGE)
+        else:
+            await send_telegram_message(chat_id, BUSY_MESSAGE)
+
+def _document_job(message: dict) -> dict:
+    document = dict(message["document"])
+    # Same upload re-delivered -> same batch client_tokens; a new upload of the same file is a new run
+    document["run_id"] = f"{document.get('file_unique_id', '')}:{message.get('message_id', '')}"
+    return document
+
+async def process_telegram_message(chat_id: int, text: str, document: dict = None):
     """Process telegram message in background with personalized greeting"""
+    if document:
+        return await process_telegram_document(chat_id, text, document)
+    if settings.TG_STREAMING:
+        return await process_telegram_message_streaming(chat_id, text)
     try:
         # Send typing indicator
         await send_telegram_message(chat_id, "กำลังประมวลผล... ⏳")
@@ -111,26 +197,55 @@ async def process_telegram_message(chat_id: int, text: str):
         logger.error(f"Error processing message: {e}")
         await send_telegram_message(chat_id, f"❌ เกิดข้อผิดพลาด: {str(e)}")
 
+dispatcher = ChatDispatcher(
+    process_telegram_message,
+    workers=settings.DISPATCH_WORKERS,
+    max_pending=settings.DISPATCH_MAX_PENDING,
+)
+
+poller = TelegramPoller(telegram_client, ingest_update)
+
+async def process_telegram_message_streaming(chat_id: int, text: str):
+    """Stream the agent's answer into the placeholder via throttled message edits"""
+    progress = ProgressiveMessage(telegram_client, chat_id)
+    try:
+        await progress.start("กำลังประมวลผล... ⏳")
+        result = await run_task_with_greeting_streaming(text, str(chat_id), progress.update)
+        await progress.finish(f"✅ เสร็จแล้ว\n\n{result}")
+    except Exception as e:
+        logger.error(f"Error processing message: {e}")
+        await send_telegram_message(chat_id, f"❌ เกิดข้อผิดพลาด: {str(e)}")
+
+async def process_telegram_document(chat_id: int, caption: str, document: dict):
+    """Import an uploaded CSV/XLSX into the table named in the caption"""
+    file_name = document.get("file_name") or ""
+    if not file_name.lower().endswith(SUPPORTED_EXTENSIONS):
+        await send_telegram_message(chat_id, "📎 รองรับการนำเข้าเฉพาะไฟล์ .csv และ .xlsx ครับ")
+        return
+    table_name, table_id = resolve_table(normalize_user_text(caption or ""))
+    if not table_id:
+        await send_telegram_message(chat_id, "📎 กรุณาระบุตารางในคำบรรยายไฟล์ เช่น `table: ลูกค้า` แล้วส่งไฟล์อีกครั้งครับ")
+        return
+
+    progress = ProgressiveMessage(telegram_client, chat_id)
+
+    async def on_progress(report):
+        await progress.update(f"📥 กำลังนำเข้า {file_name} → {table_name}: เพิ่มแล้ว {report.succeeded} รายการ...")
+
+    try:
+        await progress.start(f"📥 กำลังนำเข้า {file_name} → {table_name}... ⏳")
+        report = await table_importer.import_telegram_document(
+            document, table_id, table_name, run_id=document.get("run_id", ""), on_progress=on_progress
+        )
+        await progress.finish(report.summary())
+    except Exception as e:
+        logger.error(f"Error importing {file_name}: {e}")
+        await send_telegram_message(chat_id, f"❌ นำเข้าไฟล์ไม่สำเร็จ: {str(e)}")
+
 async def send_telegram_message(chat_id: int, text: str):
     """Send message to Telegram"""
-    import aiohttp
-    
-    if not settings.TG_API:
-        logger.error("Telegram token not configured")
-        return
-        
-    url = f"{settings.TG_API}/sendMessage"
-    data = {
-        "chat_id": chat_id,
-        "text": text,
-        "parse_mode": "Markdown"
-    }
-    
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.post(url, json=data) as response:
-                if response.status != 200:
-                    logger.error(f"Failed to send telegram message: {await response.text()}")
+        await telegram_client.send_message(chat_id, text)
     except Exception as e:
         logger.error(f"Error sending telegram message: {e}")
 
@@ -138,6 +253,6 @@ async def send_telegram_message(chat_id: int, text: str):
 async def root():
     return {
         "message": "Lark MCP Agent API v6.2 with Personalized Greeting", 
-        "endpoints": ["/health", "/mcp/health", "/agent/run", "/telegram/webhook"],
+        "endpoints": ["/health", "/mcp/health", "/agent/run", "/agent/usage", "/telegram/webhook"],
         "features": ["Staff name greeting by Chat ID", "Natural Thai responses", "Technical message filtering"]
     }
@@ -1,5 +1,16 @@
+import asyncio
+import hashlib
+import json
+import logging
+import time
 from langchain_mcp_adapters.client import MultiServerMCPClient
+from langchain_mcp_adapters.tools import convert_mcp_tool_to_langchain_tool
+from mcp.types import CallToolResult, TextContent
 from .config import settings
+from .mcp_guard import ErrorCode, MCPError, lark_error, tool_error, tool_guard
+from .tool_cache import tool_base_name, tool_cache
+
+logger = logging.getLogger(__name__)
 
 def _assert_base_lock(url: str):
     if settings.BASE_LOCK and settings.LARK_ALLOWED_BASE_PREFIX:
@@ -30,7 +41,299 @@ def _build_cfg():
 
     return cfg
 
+def _error_text(e: BaseException) -> str:
+    # Transport failures surface as task-group ExceptionGroups; report the root cause
+    while isinstance(e, BaseExceptionGroup) and e.exceptions:
+        e = e.exceptions[0]
+    return str(e) or type(e).__name__
+
+def _catalog_key(cfg: dict) -> str:
+    """Cache key for a server config: transport, URL and auth header."""
+    raw = json.dumps(
+        {"transport": cfg.get("transport"), "url": cfg.get("url"), "headers": cfg.get("headers")},
+        sort_keys=True,
+    )
+    return hashlib.sha256(raw.encode()).hexdigest()[:16]
+
+def _schema_hash(mcp_tools) -> str:
+    schema = sorted((t.name, t.description or "", t.inputSchema) for t in mcp_tools)
+    return hashlib.sha256(json.dumps(schema, sort_keys=True, default=str).encode()).hexdigest()
+
+def _result_text(result) -> str:
+    return "".join(getattr(c, "text", "") for c in result.content or [])
+
+def _decode_tool_result(tool_name: str, result) -> dict:
+    text = _result_text(result)
+    if result.isError:
+        raise tool_error(tool_name, text)
+    try:
+        data = json.loads(text) if text else (result.structuredContent or {})
+    except ValueError:
+        data = result.structuredContent or {"text": text}
+    # Raw OpenAPI envelopes: {"code": 0, "msg": "success", "data": {...}}
+    if isinstance(data, dict) and "code" in data and "data" in data:
+        if data.get("code") not in (0, None):
+            raise lark_error(tool_name, data.get("code"), data.get("msg"))
+        data = data.get("data") or {}
+    return data if isinstance(data, dict) else {"items": data}
+
+async def _list_all_tools(session):
+    tools, cursor = [], None
+    while True:
+        page = await session.list_tools(cursor=cursor)
+        tools.extend(page.tools or [])
+        cursor = page.nextCursor
+        if not cursor:
+            return tools
+
+class ToolCatalog:
+    """Discovered tools for one MCP server config.
+
+    `version` only moves when the schema hash changes, so anything built
+    from the tools (e.g. compiled agents) can key on it.
+    """
+
+    def __init__(self, key: str):
+        self.key = key
+        self.tools = []
+        self.schema_hash = None
+        self.version = 0
+        self.loaded_at = None
+        self._names = {}
+
+    def expired(self, ttl: float) -> bool:
+        return self.loaded_at is None or time.monotonic() - self.loaded_at >= ttl
+
+    def set_tools(self, tools, schema_hash: str):
+        self.tools = tools
+        self.schema_hash = schema_hash
+        self.version += 1
+        self._names = {tool_base_name(t.name): t.name for t in tools}
+
+    def resolve(self, name: str) -> str:
+        """Map a tool name as written in code onto the server's tool name,
+        falling back to a suffix match (e.g. "appTableRecord_search")."""
+        wanted = tool_base_name(name)
+        if wanted in self._names:
+            return self._names[wanted]
+        for normalized, real in list(self._names.items()):
+            if normalized.endswith("_" + wanted):
+                self._names[wanted] = real
+                return real
+        raise MCPError(ErrorCode.TOOL_NOT_FOUND, f"MCP tool not found: {name}", name)
+
+class _SessionProxy:
+    """Stands in for a ClientSession inside LangChain tools so the tool
+    objects survive reconnects and always call the live session."""
+
+    def __init__(self, manager: "MCPSessionManager"):
+        self._manager = manager
+
+    async def call_tool(self, name, arguments=None, **kwargs):
+        async def attempt():
+            session = await self._manager.wait_session()
+            result = await session.call_tool(name, arguments, **kwargs)
+            if result.isError:
+                # Not raised (the LLM reads the error), but a 429 must still slow the family down
+                tool_guard.observe(name, tool_error(name, _result_text(result)))
+            return result
+
+        try:
+            # Same deadline/breaker as direct calls
+            return await tool_guard.call(self._manager.server_name, name, attempt)
+        except MCPError as e:
+            # Raised, it would abort the whole agent run; as an isError result
+            # it reaches the LLM like any other tool failure and can be explained
+            return CallToolResult(isError=True, content=[TextContent(type="text", text=f"{e.code.value}: {e}")])
+        finally:
+            # Agent writes must not leave stale reads in the handler's cache
+            tool_cache.observe(name, arguments)
+
+class MCPSessionManager:
+    """Long-lived MCP session shared by every request.
+
+    The session is owned by one supervisor task because the underlying
+    transports must be entered and exited from the same task. It pings the
+    server periodically and reconnects with exponential backoff when the
+    transport drops; requests only ever read the cached tool catalog, which
+    the same task refreshes in the background every MCP_TOOL_CACHE_TTL.
+    """
+
+    def __init__(self, server_name: str = "lark"):
+        self.server_name = server_name
+        self._session = None
+        self._proxy = _SessionProxy(self)
+        self._catalogs = {}
+        self._catalog_key = None
+        self._refresh_lock = asyncio.Lock()
+        self._ready = asyncio.Event()
+        self._stop = asyncio.Event()
+        self._task = None
+        self.connected_at = None
+        self.reconnects = 0
+        self.last_error = None
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.catalog_refreshes = 0
+
+    @property
+    def catalog(self):
+        return self._catalogs.get(self._catalog_key)
+
+    @property
+    def connected(self) -> bool:
+        return self._session is not None
+
+    async def start(self):
+        if self._task and not self._task.done():
+            return
+        self._stop.clear()
+        self._task = asyncio.create_task(self._supervise(), name="mcp-session")
+
+    async def stop(self):
+        self._stop.set()
+        if not self._task:
+            return
+        try:
+            await asyncio.wait_for(self._task, timeout=settings.MCP_PING_TIMEOUT)
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            self._task.cancel()
+        except Exception as e:
+            logger.error(f"MCP session shutdown error: {e}")
+        self._task = None
+
+    async def wait_session(self):
+        await self.start()
+        try:
+            await asyncio.wait_for(self._ready.wait(), timeout=settings.MCP_CONNECT_TIMEOUT)
+        except asyncio.TimeoutError:
+            raise MCPError(ErrorCode.UNAVAILABLE, f"MCP session not available: {self.last_error or 'connect timeout'}")
+        return self._session
+
+    async def get_catalog(self) -> ToolCatalog:
+        await self.wait_session()
+        catalog = self.catalog
+        if catalog and not catalog.expired(settings.MCP_TOOL_CACHE_TTL):
+            self.cache_hits += 1
+            return catalog
+
+        self.cache_misses += 1
+        try:
+            catalog = await self.refresh_catalog()
+        except Exception as e:
+            if not catalog:
+                raise
+            logger.warning(f"Tool catalog refresh failed, serving cached tools: {e}")
+        return catalog
+
+    async def get_tools(self):
+        catalog = await self.get_catalog()
+        return list(catalog.tools)
+
+    async def call_tool(self, name: str, arguments: dict = None) -> dict:
+        """Call an MCP tool directly (no LLM) and decode its JSON result.
+
+        Runs under tool_guard: failures raise MCPError with an ErrorCode."""
+        async def attempt():
+            catalog = await self.get_catalog()
+            tool_name = catalog.resolve(name)
+            session = await self.wait_session()
+            result = await session.call_tool(tool_name, arguments or {})
+            return _decode_tool_result(tool_name, result)
+
+        return await tool_guard.call(self.server_name, name, attempt)
+
+    async def refresh_catalog(self, force: bool = False) -> ToolCatalog:
+        """Re-list the server's tools; rebuild tool objects only if the schema changed."""
+        async with self._refresh_lock:
+            session = self._session
+            if session is None:
+                raise RuntimeError("MCP session not connected")
+            catalog = self._catalogs.setdefault(self._catalog_key, ToolCatalog(self._catalog_key))
+            # Another caller may have refreshed while we waited for the lock
+            if not force and catalog.tools and not catalog.expired(settings.MCP_TOOL_CACHE_TTL):
+                return catalog
+
+            mcp_tools = await _list_all_tools(session)
+            schema_hash = _schema_hash(mcp_tools)
+            if schema_hash != catalog.schema_hash:
+                catalog.set_tools(
+                    [convert_mcp_tool_to_langchain_tool(self._proxy, t, server_name=self.server_name)
+                     for t in mcp_tools],
+                    schema_hash,
+                )
+                logger.info(f"MCP tool catalog v{catalog.version}: {len(catalog.tools)} tools")
+            catalog.loaded_at = time.monotonic()
+            self.catalog_refreshes += 1
+            return catalog
+
+    def stats(self) -> dict:
+        catalog = self.catalog
+        return {
+            "connected": self.connected,
+            "connected_at": self.connected_at,
+            "reconnects": self.reconnects,
+            "last_error": self.last_error,
+            "tool_cache": {
+                "hits": self.cache_hits,
+                "misses": self.cache_misses,
+                "refreshes": self.catalog_refreshes,
+                "ttl": settings.MCP_TOOL_CACHE_TTL,
+                "version": catalog.version if catalog else 0,
+                "schema_hash": catalog.schema_hash[:12] if catalog and catalog.schema_hash else None,
+            },
+        }
+
+    async def _supervise(self):
+        backoff = settings.MCP_RECONNECT_MIN_BACKOFF
+        while not self._stop.is_set():
+            try:
+                cfg = _build_cfg()
+                client = MultiServerMCPClient({self.server_name: cfg})
+                async with client.session(self.server_name) as session:
+                    self._catalog_key = _catalog_key(cfg)
+                    self._session = session
+                    catalog = await self.refresh_catalog(force=True)
+                    self.connected_at = time.time()
+                    self.last_error = None
+                    self._ready.set()
+                    backoff = settings.MCP_RECONNECT_MIN_BACKOFF
+                    logger.info(f"MCP session connected ({len(catalog.tools)} tools)")
+                    await self._keepalive(session)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.last_error = _error_text(e)
+                logger.error(f"MCP session error: {self.last_error}")
+            finally:
+                self._ready.clear()
+                self._session = None
+
+            if self._stop.is_set():
+                break
+            self.reconnects += 1
+            logger.info(f"Reconnecting to MCP in {backoff:.1f}s")
+            if await self._wait_stop(backoff):
+                break
+            backoff = min(backoff * 2, settings.MCP_RECONNECT_MAX_BACKOFF)
+
+    async def _keepalive(self, session):
+        while not await self._wait_stop(settings.MCP_PING_INTERVAL):
+            if self.catalog.expired(settings.MCP_TOOL_CACHE_TTL):
+                # Background refresh doubles as the keepalive ping
+                await asyncio.wait_for(self.refresh_catalog(), timeout=settings.MCP_CONNECT_TIMEOUT)
+            else:
+                await asyncio.wait_for(session.send_ping(), timeout=settings.MCP_PING_TIMEOUT)
+
+    async def _wait_stop(self, timeout: float) -> bool:
+        """Sleep up to `timeout` seconds; return True if stop was requested."""
+        try:
+            await asyncio.wait_for(self._stop.wait(), timeout=timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+mcp_manager = MCPSessionManager()
+
 async def get_mcp_tools():
-    cfg = _build_cfg()
-    client = MultiServerMCPClient({"lark": cfg})
-    return await client.get_tools()
+    return await mcp_manager.get_tools()
@@ -0,0 +1,306 @@
+# Deadlines, retries and circuit breaking around MCP tool calls
+# A stalled Lark MCP bridge used to hold every caller (and its background
+# task) for as long as the transport felt like. Each call now gets a
+# per-tool deadline, reads are retried with jitter, and an endpoint that
+# keeps failing is short-circuited until it has had time to recover.
+# Failures are raised as MCPError with a code, so callers branch on codes
+# instead of matching error text.
+
+import asyncio
+import json
+import logging
+import random
+import re
+import time
+from enum import Enum
+from typing import Awaitable, Callable, Dict, Optional
+from .config import settings
+from .rate_limit import RateLimiter, rate_limiter
+from .tool_cache import tool_base_name
+
+logger = logging.getLogger(__name__)
+
+class ErrorCode(str, Enum):
+    TIMEOUT = "timeout"
+    UNAVAILABLE = "unavailable"          # session down / transport failure
+    CIRCUIT_OPEN = "circuit_open"
+    RATE_LIMITED = "rate_limited"
+    CONFLICT = "conflict"                # concurrent writes to one table
+    TOOL_NOT_FOUND = "tool_not_found"
+    FIELD_NOT_FOUND = "field_not_found"
+    TABLE_NOT_FOUND = "table_not_found"
+    NOT_FOUND = "not_found"
+    PERMISSION = "permission"
+    INVALID = "invalid"
+    UNKNOWN = "unknown"
+
+# Worth trying again after a pause
+TRANSIENT_CODES = {ErrorCode.TIMEOUT, ErrorCode.UNAVAILABLE, ErrorCode.RATE_LIMITED, ErrorCode.CONFLICT}
+
+# Only these mean the endpoint itself is unhealthy; a missing field is not
+BREAKER_CODES = {ErrorCode.TIMEOUT, ErrorCode.UNAVAILABLE}
+
+# Lark OpenAPI error codes
+LARK_CODES = {
+    99991400: ErrorCode.RATE_LIMITED,
+    1254290: ErrorCode.RATE_LIMITED,
+    1254291: ErrorCode.CONFLICT,
+    1254045: ErrorCode.FIELD_NOT_FOUND,
+    1254041: ErrorCode.TABLE_NOT_FOUND,
+    1254040: ErrorCode.NOT_FOUND,
+    1254043: ErrorCode.NOT_FOUND,
+    1254302: ErrorCode.PERMISSION,
+    91403: ErrorCode.PERMISSION,
+    99991672: ErrorCode.PERMISSION,
+    1254000: ErrorCode.INVALID,
+    1254001: ErrorCode.INVALID,
+}
+
+# Bridges that only return prose: first marker found decides the code.
+# Markers are whole words or phrases, so a record ID or field value that
+# happens to contain "429" or "invalidated" is not read as an error code.
+TEXT_MARKERS = tuple((re.compile(pattern, re.IGNORECASE), code) for pattern, code in (
+    (r"fieldnamenotfound", ErrorCode.FIELD_NOT_FOUND),
+    (r"tableidnotfound", ErrorCode.TABLE_NOT_FOUND),
+    (r"tablenotfound", ErrorCode.TABLE_NOT_FOUND),
+    (r"\btoo many requests?\b", ErrorCode.RATE_LIMITED),
+    (r"\brate limit", ErrorCode.RATE_LIMITED),
+    (r"\bfrequency limit", ErrorCode.RATE_LIMITED),
+    (r"\b(?:http|status|code|error)[\s=:\"/]*429\b", ErrorCode.RATE_LIMITED),
+    (r"\bpermission", ErrorCode.PERMISSION),
+    (r"\bforbidden\b", ErrorCode.PERMISSION),
+    (r"\baccess denied\b", ErrorCode.PERMISSION),
+    (r"\bvalidation (?:failed|error)", ErrorCode.INVALID),
+    (r"\binvalid[ _]?(?:param(?:eter)?s?|argument|request|value|format|type|filter)\b", ErrorCode.INVALID),
+    (r"\btimed out\b", ErrorCode.TIMEOUT),
+))
+
+# JSON-RPC errors from the MCP server itself
+_JSONRPC_CODES = {-32001: ErrorCode.TIMEOUT, -32601: ErrorCode.TOOL_NOT_FOUND, -32602: ErrorCode.INVALID}
+
+# Tool verbs that never change anything and can be re-sent
+READ_VERBS = {"list", "get", "search", "getNode", "query", "rawContent"}
+
+class MCPError(RuntimeError):
+    def __init__(self, code: ErrorCode, message: str, tool: str = "", lark_code: Optional[int] = None):
+        super().__init__(message)
+        self.code = code
+        self.tool = tool
+        self.lark_code = lark_code
+
+    @property
+    def transient(self) -> bool:
+        return self.code in TRANSIENT_CODES
+
+def _text_code(text: str) -> ErrorCode:
+    for marker, code in TEXT_MARKERS:
+        if marker.search(text):
+            return code
+    return ErrorCode.UNKNOWN
+
+def lark_error(tool: str, lark_code, message: str) -> MCPError:
+    """MCPError for a failed Lark OpenAPI envelope ({"code": N, "msg": ...})"""
+    try:
+        lark_code = int(lark_code)
+    except (TypeError, ValueError):
+        lark_code = None
+    code = LARK_CODES.get(lark_code) or _text_code(message or "")
+    return MCPError(code, f"{tool} failed: code={lark_code} msg={message}", tool, lark_code)
+
+def tool_error(tool: str, text: str) -> MCPError:
+    """MCPError for an isError tool result, which may carry a Lark envelope"""
+    try:
+        data = json.loads(text)
+    except ValueError:
+        data = None
+    if isinstance(data, dict) and "code" in data:
+        return lark_error(tool, data.get("code"), data.get("msg") or data.get("message") or text)
+    match = re.search(r"\bcode[=:\s\"]+(\d{5,})", text or "")
+    if match and int(match.group(1)) in LARK_CODES:
+        return lark_error(tool, match.group(1), text)
+    return MCPError(_text_code(text or ""), text or f"MCP tool {tool} failed", tool)
+
+def classify(error: BaseException, tool: str = "") -> MCPError:
+    """Wrap any failure of an MCP call as an MCPError"""
+    if isinstance(error, MCPError):
+        return error
+    if isinstance(error, TimeoutError):
+        return MCPError(ErrorCode.TIMEOUT, f"{tool or 'MCP call'} timed out", tool)
+    jsonrpc = getattr(error, "error", None)
+    if jsonrpc is not None and hasattr(jsonrpc, "code"):
+        return MCPError(_JSONRPC_CODES.get(jsonrpc.code, _text_code(str(error))), str(error), tool)
+    while isinstance(error, BaseExceptionGroup) and error.exceptions:
+        error = error.exceptions[0]
+    # Anything else escaping the transport (httpx, anyio stream errors, ...)
+    return MCPError(ErrorCode.UNAVAILABLE, str(error) or type(error).__name__, tool)
+
+def error_code(error) -> ErrorCode:
+    """Code of an exception (or legacy error string) for picking a reply"""
+    if isinstance(error, MCPError):
+        return error.code
+    if isinstance(error, TimeoutError):
+        return ErrorCode.TIMEOUT
+    return _text_code(str(error))
+
+def is_read_tool(name: str) -> bool:
+    return tool_base_name(name).rsplit("_", 1)[-1] in READ_VERBS
+
+class CircuitBreaker:
+    """closed -> open after `threshold` consecutive endpoint failures;
+    open -> half-open after `reset_after` seconds, letting one probe call
+    through; the probe's outcome closes or re-opens it."""
+
+    def __init__(self, name: str, threshold: int, reset_after: float):
+        self.name = name
+        self.threshold = threshold
+        self.reset_after = reset_after
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.probing = False
+        self.trips = 0
+        self.rejected = 0
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_after:
+            return "half_open"
+        return "open"
+
+    def before_call(self, tool: str = ""):
+        state = self.state
+        if state == "closed":
+            return
+        if state == "half_open" and not self.probing:
+            self.probing = True
+            return
+        self.rejected += 1
+        retry_in = max(0.0, self.reset_after - (time.monotonic() - self.opened_at))
+        raise MCPError(ErrorCode.CIRCUIT_OPEN, f"MCP endpoint unavailable, retry in {retry_in:.0f}s", tool)
+
+    def record(self, error: Optional[MCPError]):
+        if error is None or error.code not in BREAKER_CODES:
+            # A business error still proves the endpoint answers
+            self.failures = 0
+            self.opened_at = None
+            self.probing = False
+            return
+        self.failures += 1
+        if self.probing or self.failures >= self.threshold:
+            if self.opened_at is None or self.probing:
+                self.trips += 1
+                logger.warning(f"MCP circuit '{self.name}' open after {self.failures} failures: {error}")
+            self.opened_at = time.monotonic()
+            self.probing = False
+
+    def release_probe(self):
+        """The probe ended without an outcome (cancelled); let another one through"""
+        self.probing = False
+
+    def stats(self) -> dict:
+        return {"state": self.state, "failures": self.failures, "trips": self.trips, "rejected": self.rejected}
+
+class ToolCallGuard:
+    """Runs MCP tool calls under a rate limit, a deadline and a per-endpoint breaker.
+
+    Reads (list/get/search) are retried on transient errors with jittered
+    exponential backoff, all inside the breaker; writes are sent once and
+    left to callers that can make them idempotent (see BatchWriter).
+    """
+
+    def __init__(self, timeouts: Dict[str, float], default_timeout: float, read_retries: int,
+                 breaker_threshold: int, breaker_reset: float, limiter: RateLimiter = None,
+                 base_delay: float = 0.5, max_delay: float = 5.0):
+        self.timeouts = timeouts
+        self.default_timeout = default_timeout
+        self.read_retries = read_retries
+        self.breaker_threshold = breaker_threshold
+        self.breaker_reset = breaker_reset
+        self.limiter = limiter
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self.calls = 0
+        self.retries = 0
+        self.timeouts_hit = 0
+
+    def timeout(self, name: str) -> float:
+        base = tool_base_name(name)
+        if base in self.timeouts:
+            return self.timeouts[base]
+        verb = base.rsplit("_", 1)[-1]
+        return self.timeouts.get(verb, self.default_timeout)
+
+    def breaker(self, endpoint: str) -> CircuitBreaker:
+        if endpoint not in self._breakers:
+            self._breakers[endpoint] = CircuitBreaker(endpoint, self.breaker_threshold, self.breaker_reset)
+        return self._breakers[endpoint]
+
+    async def call(self, endpoint: str, name: str, call: Callable[[], Awaitable], read: Optional[bool] = None):
+        """Await `call()` for tool `name`; failures come out as MCPError"""
+        breaker = self.breaker(endpoint)
+        retries = self.read_retries if (is_read_tool(name) if read is None else read) else 0
+        deadline = self.timeout(name)
+        attempt = 0
+        self.calls += 1
+        while True:
+            breaker.before_call(name)
+            try:
+                if self.limiter:
+                    # Waiting for a token is not the endpoint being slow: outside the deadline
+                    await self.limiter.acquire(name)
+                async with asyncio.timeout(deadline):
+                    result = await call()
+            except asyncio.CancelledError:
+                breaker.release_probe()
+                raise
+            except Exception as e:
+                error = classify(e, name)
+                self.observe(name, error)
+                if error.code is ErrorCode.TIMEOUT:
+                    self.timeouts_hit += 1
+                breaker.record(error)
+                if attempt >= retries or not error.transient or breaker.state != "closed":
+                    if error is e:
+                        raise
+                    raise error from e
+                delay = min(self.max_delay, self.base_delay * 2 ** attempt) * random.uniform(0.5, 1.0)
+                attempt += 1
+                self.retries += 1
+                logger.info(f"MCP {tool_base_name(name)} {error.code.value}, retry {attempt} in {delay:.1f}s")
+                await asyncio.sleep(delay)
+            else:
+                breaker.record(None)
+                self.observe(name, None)
+                return result
+
+    def observe(self, name: str, error: Optional[MCPError]):
+        """Feed a call's outcome to the rate limiter (also used for isError
+        results that reach the agent without raising)"""
+        if self.limiter:
+            self.limiter.observe(name, error is not None and error.code is ErrorCode.RATE_LIMITED)
+
+    def stats(self) -> dict:
+        return {
+            "calls": self.calls,
+            "retries": self.retries,
+            "timeouts": self.timeouts_hit,
+            "breakers": {name: b.stats() for name, b in self._breakers.items()},
+        }
+
+def _timeouts() -> Dict[str, float]:
+    # Keys are tool base names or verbs; MCP_TOOL_TIMEOUTS_JSON adds or overrides entries
+    timeouts = {"list": 15.0, "get": 15.0, "search": 20.0,
+                "batchCreate": 60.0, "batchUpdate": 60.0, "batchDelete": 60.0}
+    timeouts.update({tool_base_name(str(k)): float(v) for k, v in settings.MCP_TOOL_TIMEOUTS.items()})
+    return timeouts
+
+tool_guard = ToolCallGuard(
+    _timeouts(),
+    settings.MCP_CALL_TIMEOUT,
+    settings.MCP_READ_RETRIES,
+    settings.MCP_BREAKER_THRESHOLD,
+    settings.MCP_BREAKER_RESET,
+    rate_limiter,
+)
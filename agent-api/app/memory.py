@@ -0,0 +1,212 @@
+# Per-chat conversation memory for the agent
+# A LangGraph checkpointer keeps each Telegram chat's history under thread_id =
+# chat_id, so follow-ups ("แก้อันเมื่อกี้") can use earlier tool results instead
+# of searching Lark again. History is bounded per chat and across chats.
+
+import logging
+import uuid
+from collections import OrderedDict
+from contextlib import AsyncExitStack
+from typing import Awaitable, Callable, List, Optional, Tuple
+from typing_extensions import NotRequired
+from langchain_core.messages import AIMessage, AnyMessage, HumanMessage, RemoveMessage, SystemMessage, ToolMessage
+from langgraph.graph.message import REMOVE_ALL_MESSAGES
+from langgraph.checkpoint.memory import InMemorySaver
+from langgraph.prebuilt.chat_agent_executor import AgentState
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+_ONESHOT_PREFIX = "oneshot-"
+
+# Stands in for the result of a tool call whose run died before it answered
+INTERRUPTED_TOOL_RESULT = "❌ เครื่องมือทำงานไม่สำเร็จ (การทำงานถูกยกเลิกกลางคัน) ห้ามถือว่าการทำงานนี้สำเร็จ"
+
+class MemoryState(AgentState):
+    """Agent state plus the rolling summary and this request's system messages.
+
+    System messages live outside `messages` so they are replaced on every
+    request instead of piling up in the stored history."""
+    summary: NotRequired[str]
+    system_messages: NotRequired[List[SystemMessage]]
+
+Summarizer = Callable[[str, List[AnyMessage]], Awaitable[str]]
+
+def close_dangling_tool_calls(messages: List[AnyMessage]) -> Tuple[List[AnyMessage], bool]:
+    """Give every tool call without a ToolMessage an error result right after
+    its AIMessage. A run that raised inside a tool still checkpoints the
+    call, and the model API rejects such a history on every later turn."""
+    answered = {m.tool_call_id for m in messages if isinstance(m, ToolMessage)}
+    closed, patched = [], False
+    for message in messages:
+        closed.append(message)
+        if isinstance(message, AIMessage):
+            for call in message.tool_calls:
+                if call["id"] not in answered:
+                    closed.append(ToolMessage(
+                        content=INTERRUPTED_TOOL_RESULT, tool_call_id=call["id"], name=call["name"], status="error"
+                    ))
+                    patched = True
+    return closed, patched
+
+def make_history_hook(summarize: Summarizer, max_turns: int):
+    """pre_model_hook that keeps the last `max_turns` user turns verbatim and
+    folds older ones into the summary.
+
+    Turns are cut at HumanMessage boundaries, so a tool call is never
+    separated from its ToolMessage. Tool calls left unanswered by a failed
+    run are closed first, in the stored history as well."""
+
+    async def history_hook(state: dict) -> dict:
+        messages, patched = close_dangling_tool_calls(list(state["messages"]))
+        summary = state.get("summary") or ""
+        update = {}
+
+        turn_starts = [i for i, m in enumerate(messages) if isinstance(m, HumanMessage)]
+        if max_turns > 0 and len(turn_starts) > max_turns:
+            cut = turn_starts[-max_turns]
+            old, messages = messages[:cut], messages[cut:]
+            try:
+                summary = await summarize(summary, old)
+            except Exception as e:
+                # Dropping the turns still bounds memory; the old summary stays
+                logger.warning(f"History summary failed, dropping {len(old)} messages: {e}")
+            update["summary"] = summary
+            update["messages"] = [RemoveMessage(id=m.id) for m in old if m.id]
+        if patched:
+            # Synthetic results must sit right after their call: rewrite the history
+            update["messages"] = [RemoveMessage(id=REMOVE_ALL_MESSAGES), *messages]
+
+        prefix = list(state.get("system_messages") or [])
+        if summary:
+            prefix.append(SystemMessage(content=f"สรุปบทสนทนาก่อนหน้า:\n{summary}"))
+        update["llm_input_messages"] = prefix + messages
+        return update
+
+    return history_hook
+
+class ChatMemory:
+    """Owns the checkpointer and forgets least recently used chats.
+
+    MEMORY_BACKEND=memory keeps threads in process; sqlite persists them to
+    MEMORY_SQLITE_PATH (needs the optional `langgraph-checkpoint-sqlite`
+    package); off disables memory. Only the latest checkpoint of a thread
+    is kept."""
+
+    def __init__(self, backend: str, max_chats: int, sqlite_path: str):
+        self.backend = backend
+        self.max_chats = max_chats
+        self.sqlite_path = sqlite_path
+        self.checkpointer = None
+        self._chats: "OrderedDict[str, None]" = OrderedDict()
+        self._stack: Optional[AsyncExitStack] = None
+        self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.checkpointer is not None
+
+    async def start(self):
+        if self.checkpointer is not None or self.backend == "off":
+            return
+        if self.backend == "sqlite":
+            try:
+                from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+            except ImportError:
+                raise RuntimeError("MEMORY_BACKEND=sqlite requires the 'langgraph-checkpoint-sqlite' package")
+            self._stack = AsyncExitStack()
+            self.checkpointer = await self._stack.enter_async_context(
+                AsyncSqliteSaver.from_conn_string(self.sqlite_path)
+            )
+        else:
+            self.checkpointer = InMemorySaver()
+        logger.info(f"Chat memory enabled ({self.backend}, last {settings.MEMORY_MAX_TURNS} turns, {self.max_chats} chats)")
+
+    async def stop(self):
+        if self._stack:
+            await self._stack.aclose()
+            self._stack = None
+        self.checkpointer = None
+        self._chats.clear()
+
+    async def thread_config(self, chat_id: str) -> dict:
+        """Run config for a chat; requests without a chat get a throwaway thread."""
+        if not self.enabled:
+            return {}
+        if not chat_id:
+            return {"configurable": {"thread_id": f"{_ONESHOT_PREFIX}{uuid.uuid4().hex}"}}
+
+        thread_id = str(chat_id)
+        self._chats[thread_id] = None
+        self._chats.move_to_end(thread_id)
+        while len(self._chats) > self.max_chats:
+            oldest, _ = self._chats.popitem(last=False)
+            await self._delete(oldest)
+            self.evictions += 1
+        return {"configurable": {"thread_id": thread_id}}
+
+    async def release(self, config: dict):
+        """After a run: drop throwaway threads, keep only the latest checkpoint otherwise."""
+        thread_id = (config.get("configurable") or {}).get("thread_id")
+        if not thread_id or not self.enabled:
+            return
+        if thread_id.startswith(_ONESHOT_PREFIX):
+            await self._delete(thread_id)
+            return
+        try:
+            try:
+                await self.checkpointer.aprune([thread_id], strategy="keep_latest")
+            except NotImplementedError:
+                await self._keep_latest(thread_id)
+        except Exception as e:
+            logger.warning(f"Pruning checkpoints for {thread_id} failed: {e}")
+
+    async def _keep_latest(self, thread_id: str):
+        """Savers without prune: rewrite the thread as its latest checkpoint alone"""
+        latest = await self.checkpointer.aget_tuple({"configurable": {"thread_id": thread_id}})
+        if latest is None or latest.parent_config is None:
+            return
+        checkpoint = latest.checkpoint
+        await self.checkpointer.adelete_thread(thread_id)
+        await self.checkpointer.aput(
+            {"configurable": {"thread_id": thread_id, "checkpoint_ns": latest.config["configurable"].get("checkpoint_ns", "")}},
+            checkpoint,
+            latest.metadata,
+            checkpoint["channel_versions"],
+        )
+
+    async def append(self, get_graph: Callable[[], Awaitable], chat_id: str, messages: List[AnyMessage]):
+        """Add an exchange answered outside the agent (the fast path) to a
+        chat's history, as if the agent had replied. Best effort: the user
+        already has the answer."""
+        if not self.enabled or not chat_id:
+            return
+        config = await self.thread_config(chat_id)
+        try:
+            graph = await get_graph()
+            await graph.aupdate_state(config, {"messages": messages}, as_node="agent")
+        except Exception as e:
+            logger.warning(f"Recording fast-path reply for {chat_id} failed: {e}")
+        finally:
+            await self.release(config)
+
+    async def forget(self, chat_id: str):
+        self._chats.pop(str(chat_id), None)
+        await self._delete(str(chat_id))
+
+    async def _delete(self, thread_id: str):
+        try:
+            await self.checkpointer.adelete_thread(thread_id)
+        except Exception as e:
+            logger.warning(f"Deleting memory thread {thread_id} failed: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "backend": self.backend if self.enabled else "off",
+            "chats": len(self._chats),
+            "max_chats": self.max_chats,
+            "max_turns": settings.MEMORY_MAX_TURNS,
+            "evictions": self.evictions,
+        }
+
+chat_memory = ChatMemory(settings.MEMORY_BACKEND, settings.MEMORY_MAX_CHATS, settings.MEMORY_SQLITE_PATH)
@@ -0,0 +1,74 @@
+# One-pass Thai abbreviation / typo normalizer
+# Extendable with NORMALIZE_MAP_JSON without code changes
+
+import unicodedata
+from typing import Dict
+from .config import settings
+from .text_match import compile_phrases
+
+# Common typos and abbreviations in Thai
+ABBREVIATIONS = {
+    "งน": "งาน",
+    "ลค": "ลูกค้า",
+    "ขย": "ขาย",
+    "ขข": "ข้อมูล",
+    "เพิ่ม": "เพิ่มข้อมูล",
+    "ดู": "ดูข้อมูล",
+    "ลบ": "ลบข้อมูล"
+}
+
+def _is_word_char(ch: str) -> bool:
+    """Letters, digits and Thai vowel/tone marks (category M*) continue a word"""
+    return ch.isalnum() or unicodedata.category(ch).startswith("M")
+
+class TextNormalizer:
+    """Leftmost-longest replacement over a trie regex in a single pass.
+
+    Replacements are never re-scanned, and every expansion is also a key
+    that maps to itself, so text that is already expanded ("ดูข้อมูล") wins
+    the longest match and is left alone instead of becoming
+    "ดูข้อมูลข้อมูล".
+
+    Thai has no spaces between words, so a key is only expanded when it is
+    a whole token: the characters on both sides are not letters, digits or
+    marks. "ดู ลค" expands, while "ดูแล", "ฤดูฝน" and "ขยาย" are left alone.
+    "ดู ข้อมูล" is not expanded either, since the rest of the expansion
+    already follows.
+    """
+
+    def __init__(self, replacements: Dict[str, str]):
+        self._table = {new: new for new in replacements.values()}
+        self._table.update(replacements)
+        self._regex = compile_phrases(self._table)
+
+    def normalize(self, text: str) -> str:
+        if not text or not self._regex:
+            return text
+        table = self._table
+
+        def expand(match):
+            found = match.group()
+            start, end = match.span()
+            if start > 0 and _is_word_char(text[start - 1]):
+                return found
+            if end < len(text) and _is_word_char(text[end]):
+                return found
+            expansion = table[found]
+            tail = expansion[len(found):].strip() if expansion.startswith(found) else ""
+            if tail and text[end:].lstrip().startswith(tail):
+                return found
+            return expansion
+
+        return self._regex.sub(expand, text)
+
+def _replacements() -> Dict[str, str]:
+    replacements = dict(ABBREVIATIONS)
+    # NORMALIZE_MAP_JSON='{"abbr": "expansion"}' adds or overrides entries
+    replacements.update({str(k): str(v) for k, v in settings.NORMALIZE_MAP.items()})
+    return replacements
+
+text_normalizer = TextNormalizer(_replacements())
+
+def normalize_user_text(text: str) -> str:
+    """Normalize common typos and abbreviations in Thai"""
+    return text_normalizer.normalize(text)
@@ -0,0 +1,160 @@
+# Client-side rate limiting for Lark OpenAPI calls
+# Lark enforces QPS limits per app and per endpoint. Instead of finding them
+# with 429 storms, every MCP tool call (agent or handler) takes a token from
+# its tool family's bucket first and waits when the bucket is empty. A
+# rate-limit error halves the family's rate; it creeps back up while calls
+# succeed.
+
+import asyncio
+import logging
+import re
+import time
+from typing import Dict, Optional
+from .config import settings
+from .tool_cache import tool_base_name
+
+logger = logging.getLogger(__name__)
+
+class TokenBucket:
+    """`rate` tokens per second, up to `burst` saved up. acquire() waits
+    for a token instead of failing; waiters are served in arrival order."""
+
+    def __init__(self, rate: float, burst: float = None):
+        self.base_rate = rate
+        self.rate = rate
+        self.burst = max(1.0, burst or rate)
+        self.tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+        self.waits = 0
+        self.waited = 0.0
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self, tokens: float = 1.0):
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                delay = (tokens - self.tokens) / self.rate
+                self.waits += 1
+                self.waited += delay
+                await asyncio.sleep(delay)
+
+    def stats(self) -> dict:
+        return {
+            "rate": round(self.rate, 2),
+            "base_rate": self.base_rate,
+            "burst": self.burst,
+            "waits": self.waits,
+            "waited_seconds": round(self.waited, 2),
+        }
+
+class AdaptiveBucket(TokenBucket):
+    """TokenBucket that backs off on rate-limit errors (halve the rate,
+    drop saved tokens) and recovers by 10% per success once
+    `recover_after` seconds have passed since the last one."""
+
+    def __init__(self, rate: float, burst: float = None, min_rate: float = 0.2, recover_after: float = 5.0):
+        super().__init__(rate, burst)
+        self.min_rate = min(min_rate, rate)
+        self.recover_after = recover_after
+        self._slowed_at: Optional[float] = None
+        self.slowdowns = 0
+
+    def slow_down(self):
+        self._refill()
+        self.rate = max(self.min_rate, self.rate / 2)
+        self.tokens = min(self.tokens, 0.0)
+        self._slowed_at = time.monotonic()
+        self.slowdowns += 1
+
+    def speed_up(self):
+        if self.rate >= self.base_rate or self._slowed_at is None:
+            return
+        now = time.monotonic()
+        if now - self._slowed_at < self.recover_after:
+            return
+        self._refill()
+        self.rate = min(self.base_rate, self.rate * 1.1)
+        # Space out increases so one burst of successes can't undo a slowdown at once
+        self._slowed_at = now - self.recover_after + 1.0
+
+    def stats(self) -> dict:
+        return {**super().stats(), "slowdowns": self.slowdowns}
+
+# Tool family by base name, first match wins
+FAMILY_RULES = [
+    ("bitable_record_write", re.compile(r"bitable_v1_appTableRecord_(create|update|delete|batchCreate|batchUpdate|batchDelete)$")),
+    ("bitable_record_search", re.compile(r"bitable_v1_appTableRecord_(search|list|get)$")),
+    ("bitable", re.compile(r"bitable_")),
+    ("contact", re.compile(r"contact_")),
+    ("im", re.compile(r"im_")),
+    ("docx", re.compile(r"docx_")),
+    ("wiki", re.compile(r"wiki_")),
+]
+
+# Requests per second per family; RATE_LIMITS_JSON overrides
+DEFAULT_RATES = {
+    "bitable_record_write": 5,
+    "bitable_record_search": 10,
+    "bitable": 10,
+    "contact": 20,
+    "im": 20,
+    "docx": 3,
+    "wiki": 10,
+    "default": 10,
+}
+
+class RateLimiter:
+    """One AdaptiveBucket per tool family"""
+
+    def __init__(self, rates: Dict[str, float], enabled: bool = True):
+        self.enabled = enabled
+        self.buckets = {family: AdaptiveBucket(float(rate)) for family, rate in rates.items() if rate and rate > 0}
+        self._families: Dict[str, str] = {}
+
+    def family(self, name: str) -> str:
+        base = tool_base_name(name)
+        if base not in self._families:
+            self._families[base] = next(
+                (family for family, rule in FAMILY_RULES if rule.match(base)), "default"
+            )
+        return self._families[base]
+
+    def bucket(self, name: str) -> Optional[AdaptiveBucket]:
+        return self.buckets.get(self.family(name)) if self.enabled else None
+
+    async def acquire(self, name: str):
+        bucket = self.bucket(name)
+        if bucket:
+            await bucket.acquire()
+
+    def observe(self, name: str, rate_limited: bool):
+        bucket = self.bucket(name)
+        if not bucket:
+            return
+        if rate_limited:
+            bucket.slow_down()
+            logger.warning(f"Rate limited on {self.family(name)}, slowing to {bucket.rate:.2f}/s")
+        else:
+            bucket.speed_up()
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "families": {family: bucket.stats() for family, bucket in self.buckets.items()},
+        }
+
+def _rates() -> Dict[str, float]:
+    rates = dict(DEFAULT_RATES)
+    # RATE_LIMITS_JSON='{"bitable_record_write": 3}' adds or overrides families; 0 disables one
+    rates.update({str(k): float(v) for k, v in settings.RATE_LIMITS.items()})
+    return rates
+
+rate_limiter = RateLimiter(_rates(), settings.RATE_LIMIT_ENABLED)
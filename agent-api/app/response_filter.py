@@ -0,0 +1,90 @@
+# Precompiled matcher for technical text that must not reach users
+# Shared by agent.filter_response (per line) and agent.extract_ai_response_only (per message)
+
+import re
+from enum import Flag, auto
+from typing import Iterable
+from .config import settings
+from .text_match import trie_pattern
+
+class Scope(Flag):
+    MESSAGE = auto()     # anywhere in an AI message: it is a tool step, not the answer
+    LINE = auto()        # anywhere in a line of the answer
+    LINE_START = auto()  # only when it opens a line
+
+# One table for every filter, so the per-message and per-line rules can't
+# drift apart; an entry lists each scope it applies to
+TECHNICAL_PATTERNS = {
+    # Prompt echoes
+    "Use only the provided MCP tools": Scope.LINE,
+    "Use ONLY the Lark MCP base": Scope.LINE,
+    "Allowed tables (name -> id):": Scope.LINE,
+    "If the name is ambiguous or missing": Scope.LINE,
+    "If a mapped table_id is not in the hard allowlist": Scope.LINE,
+    "When the user mentions a table by name": Scope.LINE,
+    "Do NOT reference other bases": Scope.LINE,
+    "MCP tools": Scope.LINE,
+    "table_id=": Scope.LINE,
+    "base_id:": Scope.LINE,
+    "Use table_id": Scope.LINE,
+    # Message-type names and tool plumbing
+    "SystemMessage": Scope.LINE,
+    "HumanMessage": Scope.LINE,
+    "AIMessage": Scope.LINE,
+    "tool_calls": Scope.MESSAGE | Scope.LINE,
+    "function_call": Scope.MESSAGE | Scope.LINE,
+    "mcp__": Scope.MESSAGE | Scope.LINE,
+    "app_token": Scope.MESSAGE | Scope.LINE,
+    "base_id": Scope.MESSAGE,
+    "table_id": Scope.MESSAGE,
+    # System/debug output
+    "System:": Scope.LINE_START,
+    "DEBUG:": Scope.LINE_START,
+    "Error:": Scope.LINE_START,
+    "Tool:": Scope.LINE_START,
+    "Human:": Scope.LINE_START,
+    "AI:": Scope.LINE_START,
+    # Model narration of its own steps
+    "I'll": Scope.MESSAGE | Scope.LINE_START,
+    "I will": Scope.MESSAGE | Scope.LINE_START,
+    "Let me": Scope.MESSAGE | Scope.LINE_START,
+    "Based on": Scope.MESSAGE | Scope.LINE_START,
+    "I need to": Scope.MESSAGE,
+    "I should": Scope.MESSAGE,
+    "According to": Scope.MESSAGE | Scope.LINE,
+    "The result": Scope.MESSAGE,
+    "Here's what": Scope.MESSAGE,
+    "I'll help you": Scope.LINE,
+    "I will search": Scope.LINE,
+    "Let me search": Scope.LINE,
+    "Based on the search": Scope.LINE,
+    "The result shows": Scope.LINE,
+}
+
+class PatternMatcher:
+    """One trie regex over literal patterns, compiled once; a single search
+    replaces a loop over every pattern."""
+
+    def __init__(self, patterns: Iterable[str], prefix_only: bool = False):
+        self.patterns = sorted(set(p for p in patterns if p))
+        source = trie_pattern(self.patterns)
+        if prefix_only:
+            source = r"^\s*(?:" + source + ")"
+        self._regex = re.compile(source) if self.patterns else None
+
+    def search(self, text: str) -> bool:
+        return bool(self._regex and self._regex.search(text))
+
+def _patterns(scope: Scope) -> list:
+    patterns = [p for p, scopes in TECHNICAL_PATTERNS.items() if scope in scopes]
+    if scope is not Scope.LINE_START:
+        # RESPONSE_FILTER_PATTERNS_JSON adds deployment-specific substrings
+        patterns += [str(p) for p in settings.RESPONSE_FILTER_PATTERNS]
+    return patterns
+
+technical_matcher = PatternMatcher(_patterns(Scope.MESSAGE))
+line_matcher = PatternMatcher(_patterns(Scope.LINE))
+line_prefix_matcher = PatternMatcher(_patterns(Scope.LINE_START), prefix_only=True)
+
+def is_technical_line(line: str) -> bool:
+    return line_matcher.search(line) or line_prefix_matcher.search(line)
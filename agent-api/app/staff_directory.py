@@ -0,0 +1,166 @@
+# Staff directory: Telegram chat_id -> staff name from the TEAM table
+# Loaded straight through MCP (no LLM) and kept in memory
+
+import asyncio
+import logging
+import time
+from typing import Dict, Optional
+from .config import settings
+from .mcp_client import mcp_manager
+
+logger = logging.getLogger(__name__)
+
+SEARCH_TOOL = "bitable_v1_appTableRecord_search"
+PAGE_SIZE = 500
+
+def _cell_text(value) -> str:
+    """Flatten a Bitable cell (text segments, numbers, links) to a plain string."""
+    if value is None:
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    if isinstance(value, (str, int, float)):
+        return str(value).strip()
+    if isinstance(value, dict):
+        return _cell_text(value.get("text") or value.get("name") or value.get("value"))
+    if isinstance(value, list):
+        return "".join(_cell_text(v) for v in value).strip()
+    return str(value).strip()
+
+class StaffDirectory:
+    def __init__(self, mcp_client):
+        self.mcp = mcp_client
+        self._names: Dict[str, str] = {}
+        self._loaded_at: Optional[float] = None
+        self._watermark = 0  # latest last_modified_time seen (ms)
+        self._lock = asyncio.Lock()
+        self._task = None
+        self.last_error: Optional[str] = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(settings.LARK_ALLOWED_BASE_ID and settings.STAFF_TABLE_ID)
+
+    @property
+    def expired(self) -> bool:
+        if self._loaded_at is None:
+            return True
+        return time.monotonic() - self._loaded_at >= settings.STAFF_DIRECTORY_TTL
+
+    def lookup(self, chat_id) -> str:
+        return self._names.get(str(chat_id).strip(), "")
+
+    async def get_name(self, chat_id) -> str:
+        """O(1) lookup; reloads the table only when the cache has expired."""
+        if not chat_id or not self.enabled:
+            return ""
+        if self.expired:
+            try:
+                await self.load()
+            except Exception as e:
+                # Serve whatever we have rather than failing the message
+                logger.error(f"Staff directory load failed: {e}")
+        return self.lookup(chat_id)
+
+    async def load(self, force: bool = False):
+        """Full reload of the TEAM table."""
+        async with self._lock:
+            if not force and not self.expired:
+                return
+            names, watermark = {}, 0
+            async for record in self._search():
+                watermark = max(watermark, record.get("last_modified_time") or 0)
+                self._add(names, record)
+            self._names = names
+            self._watermark = watermark
+            self._loaded_at = time.monotonic()
+            self.last_error = None
+            logger.info(f"Staff directory loaded ({len(names)} entries)")
+
+    async def refresh_delta(self):
+        """Merge records modified since the last load (needs STAFF_MODIFIED_FIELD).
+
+        Without that field there is no cheap delta; the TTL alone decides
+        when the whole table is reloaded."""
+        if self._loaded_at is None:
+            return await self.load(force=True)
+        if not settings.STAFF_MODIFIED_FIELD or not self._watermark:
+            return
+        async with self._lock:
+            flt = {
+                "conjunction": "and",
+                "conditions": [{
+                    "field_name": settings.STAFF_MODIFIED_FIELD,
+                    "operator": "isGreater",
+                    "value": ["ExactDate", str(self._watermark)],
+                }],
+            }
+            names = dict(self._names)
+            async for record in self._search(flt):
+                self._watermark = max(self._watermark, record.get("last_modified_time") or 0)
+                self._add(names, record)
+            self._names = names
+
+    async def start(self):
+        if self.enabled and not (self._task and not self._task.done()):
+            self._task = asyncio.create_task(self._refresh_loop(), name="staff-directory")
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "entries": len(self._names),
+            "age": round(time.monotonic() - self._loaded_at, 1) if self._loaded_at is not None else None,
+            "last_error": self.last_error,
+        }
+
+    async def _refresh_loop(self):
+        while True:
+            try:
+                if self.expired:
+                    await self.load()
+                else:
+                    await self.refresh_delta()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.last_error = str(e)
+                logger.error(f"Staff directory refresh failed: {e}")
+            await asyncio.sleep(settings.STAFF_REFRESH_INTERVAL)
+
+    async def _search(self, flt: dict = None):
+        page_token = None
+        while True:
+            params = {"page_size": PAGE_SIZE}
+            if page_token:
+                params["page_token"] = page_token
+            data = {
+                "field_names": [settings.STAFF_CHAT_ID_FIELD, settings.STAFF_NAME_FIELD],
+                "automatic_fields": True,
+            }
+            if flt:
+                data["filter"] = flt
+            result = await self.mcp.call_tool(SEARCH_TOOL, {
+                "data": data,
+                "params": params,
+                "path": {"app_token": settings.LARK_ALLOWED_BASE_ID, "table_id": settings.STAFF_TABLE_ID},
+                "useUAT": False
+            })
+            for record in result.get("items") or []:
+                yield record
+            page_token = result.get("page_token")
+            if not result.get("has_more") or not page_token:
+                return
+
+    def _add(self, names: Dict[str, str], record: dict):
+        fields = record.get("fields", {})
+        chat_id = _cell_text(fields.get(settings.STAFF_CHAT_ID_FIELD))
+        name = _cell_text(fields.get(settings.STAFF_NAME_FIELD))
+        if chat_id and name:
+            names[chat_id] = name
+
+staff_directory = StaffDirectory(mcp_manager)
@@ -1,39 +1,80 @@
-from typing import Optional, Tuple
+import difflib
+import re
+from functools import lru_cache
+from typing import Dict, Iterable, Optional, Tuple
 from .config import settings
+from .text_match import compile_phrases
+
+# "table: X", "ตาราง X" ... -> X
+_EXPLICIT = re.compile(r"(?:table|ตาราง)(?::|\s)\s*(\S+)", re.IGNORECASE)
+_STRIP = "：:，,.;"
+
+class TableResolver:
+    """Table lookups precomputed once from TABLE_MAP.
+
+    Names and aliases are indexed lowercased, and all of them are compiled
+    into one trie regex, so finding a table mentioned in free text costs a
+    single pass over the text however many tables the map holds. Aliases
+    (TABLE_ALIASES_JSON) let Thai names point at a table; explicit
+    "table: X" mentions that match nothing exactly fall back to a fuzzy
+    match against the same index.
+    """
+
+    FUZZY_CUTOFF = 0.8
+
+    def __init__(self, table_map: Dict[str, str], allowed_ids: Iterable[str], aliases: Dict[str, str] = None):
+        self._by_name: Dict[str, Tuple[str, str]] = {
+            str(name).lower(): (name, table_id) for name, table_id in table_map.items()
+        }
+        for alias, name in (aliases or {}).items():
+            if name in table_map:
+                self._by_name.setdefault(str(alias).lower(), (name, table_map[name]))
+        self._allowed = frozenset(allowed_ids)
+        self._names_regex = compile_phrases(self._by_name)
+        self._fuzzy = lru_cache(maxsize=1024)(self._fuzzy_lookup)
+
+    def allowed(self, table_id: str) -> bool:
+        if not self._allowed:
+            return True
+        return table_id in self._allowed
+
+    def resolve(self, user_text: str) -> Tuple[Optional[str], Optional[str]]:
+        if not user_text or not self._by_name:
+            return None, None
+        lowers = user_text.strip().lower()
+
+        # Explicit "table: X" first, then any known name/alias in the text
+        for match in _EXPLICIT.finditer(lowers):
+            cand = match.group(1).strip(_STRIP)
+            hit = self._by_name.get(cand) or (self._fuzzy(cand) if cand else None)
+            if hit:
+                return self._result(hit)
+
+        if self._names_regex:
+            match = self._names_regex.search(lowers)
+            if match:
+                return self._result(self._by_name[match.group()])
+        return None, None
+
+    def strip_names(self, user_text: str) -> str:
+        """Lowercased text with every known table name/alias blanked out"""
+        lowers = (user_text or "").lower()
+        return self._names_regex.sub(" ", lowers) if self._names_regex else lowers
+
+    def _result(self, hit: Tuple[str, str]) -> Tuple[str, Optional[str]]:
+        name, table_id = hit
+        return (name, table_id) if self.allowed(table_id) else (name, None)
+
+    def _fuzzy_lookup(self, cand: str) -> Optional[Tuple[str, str]]:
+        close = difflib.get_close_matches(cand, self._by_name.keys(), n=1, cutoff=self.FUZZY_CUTOFF)
+        return self._by_name[close[0]] if close else None
+
+table_resolver = TableResolver(settings.TABLE_MAP, settings.ALLOWED_TABLE_IDS, settings.TABLE_ALIASES)
 
 def resolve_table(user_text: str) -> Tuple[Optional[str], Optional[str]]:
     """Extract a table name from user text and map to ID via TABLE_MAP.
     Returns (table_name, table_id) or (None, None)."""
-
-    if not user_text:
-        return None, None
-    t = user_text.strip()
-    lowers = t.lower()
-    # Try explicit keywords
-    candidates = []
-    for kw in ("table:", "ตาราง:", "table ", "ตาราง "):
-        if kw in lowers:
-            idx = lowers.index(kw) + len(kw)
-            seg = t[idx:].strip()
-            if seg:
-                candidates.append(seg.split()[0].strip("：:，,.;"))
-
-    # Fallback: scan known map keys
-    for name in settings.TABLE_MAP.keys():
-        if name.lower() in lowers:
-            candidates.append(name)
-
-    # Normalize against map
-    for cand in candidates:
-        for k, v in settings.TABLE_MAP.items():
-            if k.lower() == cand.lower():
-                if _table_allowed(v):
-                    return k, v
-                else:
-                    return k, None
-    return None, None
+    return table_resolver.resolve(user_text)
 
 def _table_allowed(table_id: str) -> bool:
-    if not settings.ALLOWED_TABLE_IDS:
-        return True
-    return table_id in settings.ALLOWED_TABLE_IDS
+    return table_resolver.allowed(table_id)
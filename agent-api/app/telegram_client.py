@@ -0,0 +1,295 @@
+# Application-scoped Telegram Bot API client
+# One keep-alive connector for every outbound call instead of a new TLS handshake per message.
+# Messages are paced by a global and a per-chat token bucket, resent after a
+# 429 once retry_after has passed, split at 4096 characters and resent as
+# plain text when Telegram can't parse their Markdown.
+
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+import aiofiles
+import aiohttp
+from .config import settings
+from .rate_limit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+MAX_MESSAGE_LENGTH = 4096
+
+# Per-chat buckets kept for the most recently active chats
+MAX_CHAT_BUCKETS = 1000
+
+def _utf16_len(text: str) -> int:
+    # Telegram counts message length in UTF-16 code units (emoji count twice)
+    return len(text.encode("utf-16-le")) // 2
+
+def _cut(line: str, limit: int) -> int:
+    """Index of the longest prefix of `line` within `limit`, preferring a space"""
+    units, end = 0, len(line)
+    for index, ch in enumerate(line):
+        units += 2 if ord(ch) > 0xFFFF else 1
+        if units > limit:
+            end = index
+            break
+    space = line.rfind(" ", 0, end)
+    return space + 1 if space > end // 2 else max(end, 1)
+
+def split_text(text: str, limit: int = MAX_MESSAGE_LENGTH) -> List[str]:
+    """Split text into messages of at most `limit` units, at line breaks
+    where possible and at spaces inside overlong lines"""
+    if _utf16_len(text) <= limit:
+        return [text]
+    chunks, current, size = [], "", 0
+    for line in text.splitlines(keepends=True):
+        while _utf16_len(line) > limit:
+            if current:
+                chunks.append(current)
+                current, size = "", 0
+            end = _cut(line, limit)
+            chunks.append(line[:end])
+            line = line[end:]
+        units = _utf16_len(line)
+        if size + units > limit:
+            chunks.append(current)
+            current, size = "", 0
+        current += line
+        size += units
+    if current:
+        chunks.append(current)
+    return [chunk.rstrip("\n") for chunk in chunks if chunk.strip()]
+
+def _markdown_rejected(result: Optional[dict]) -> bool:
+    return bool(result) and result.get("error_code") == 400 and "parse entities" in str(result.get("description", ""))
+
+class TelegramClient:
+    def __init__(self):
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._global = TokenBucket(settings.TG_GLOBAL_RATE)
+        self._chats: "OrderedDict[int, TokenBucket]" = OrderedDict()
+        self.sent = 0
+        self.split_messages = 0
+        self.rate_limited = 0
+        self.markdown_fallbacks = 0
+        self.failed = 0
+
+    async def start(self):
+        if self._session and not self._session.closed:
+            return
+        connector = aiohttp.TCPConnector(
+            limit=settings.TG_CONNECTION_LIMIT,
+            limit_per_host=settings.TG_CONNECTION_LIMIT,
+            ttl_dns_cache=settings.TG_DNS_CACHE_TTL,
+            keepalive_timeout=settings.TG_KEEPALIVE_TIMEOUT,
+        )
+        self._session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=settings.TG_REQUEST_TIMEOUT),
+        )
+
+    async def close(self):
+        if self._session and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    async def session(self) -> aiohttp.ClientSession:
+        # Lazily opened for callers outside the app lifespan (scripts, tests)
+        if not self._session or self._session.closed:
+            await self.start()
+        return self._session
+
+    async def call(self, method: str, payload: dict = None, timeout: float = None) -> Optional[dict]:
+        """POST a Bot API method; returns the decoded JSON response (None if not JSON)."""
+        if not settings.TG_API:
+            logger.error("Telegram token not configured")
+            return None
+        session = await self.session()
+        kwargs = {"timeout": aiohttp.ClientTimeout(total=timeout)} if timeout else {}
+        async with session.post(f"{settings.TG_API}/{method}", json=payload or {}, **kwargs) as response:
+            if response.status != 200:
+                logger.error(f"Telegram {method} failed: {await response.text()}")
+            try:
+                return await response.json(content_type=None)
+            except ValueError:
+                return None
+
+    def _chat_bucket(self, chat_id) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            try:
+                group = int(chat_id) < 0
+            except (TypeError, ValueError):
+                group = False
+            rate = settings.TG_GROUP_RATE_PER_MINUTE / 60 if group else settings.TG_CHAT_RATE
+            bucket = self._chats[chat_id] = TokenBucket(rate, settings.TG_CHAT_BURST)
+            while len(self._chats) > MAX_CHAT_BUCKETS:
+                self._chats.popitem(last=False)
+        self._chats.move_to_end(chat_id)
+        return bucket
+
+    async def send_to_chat(self, method: str, payload: dict, max_retries: int = None) -> Optional[dict]:
+        """Call a chat-bound method within the global and per-chat rate,
+        resending after a 429 once Telegram's retry_after has passed."""
+        retries = settings.TG_MAX_RETRIES if max_retries is None else max_retries
+        attempt = 0
+        while True:
+            await self._chat_bucket(payload["chat_id"]).acquire()
+            await self._global.acquire()
+            result = await self.call(method, payload)
+            if not result or result.get("error_code") != 429:
+                return result
+            self.rate_limited += 1
+            retry_after = (result.get("parameters") or {}).get("retry_after", 1)
+            if attempt >= retries:
+                return result
+            attempt += 1
+            logger.warning(f"Telegram {method} rate limited in chat {payload['chat_id']}, retry in {retry_after}s")
+            await asyncio.sleep(retry_after)
+
+    async def _send_text(self, method: str, payload: dict, max_retries: int = None) -> Tuple[Optional[dict], bool]:
+        """(response, whether Markdown had to be dropped)"""
+        result = await self.send_to_chat(method, payload, max_retries)
+        plain = False
+        if payload.get("parse_mode") and _markdown_rejected(result):
+            # Unbalanced * or _ in agent output; the words matter more than the formatting
+            self.markdown_fallbacks += 1
+            payload = {k: v for k, v in payload.items() if k != "parse_mode"}
+            result = await self.send_to_chat(method, payload, max_retries)
+            plain = True
+        if result and result.get("ok"):
+            self.sent += 1
+        else:
+            self.failed += 1
+        return result, plain
+
+    async def send_message(self, chat_id: int, text: str, parse_mode: str = "Markdown") -> Optional[dict]:
+        """Send text, split over several messages when it is too long.
+        Returns the first failed response, else the last one."""
+        chunks = split_text(text)
+        if len(chunks) > 1:
+            self.split_messages += 1
+        result = None
+        for chunk in chunks:
+            data = {"chat_id": chat_id, "text": chunk}
+            if parse_mode:
+                data["parse_mode"] = parse_mode
+            result, plain = await self._send_text("sendMessage", data)
+            if not result or not result.get("ok"):
+                return result
+            if plain:
+                # The rest of a rejected text would be rejected too
+                parse_mode = None
+        return result
+
+    async def edit_message(self, chat_id: int, message_id: int, text: str, parse_mode: str = None,
+                           max_retries: int = None) -> Optional[dict]:
+        result, _ = await self._edit_text(chat_id, message_id, text, parse_mode, max_retries)
+        return result
+
+    async def _edit_text(self, chat_id: int, message_id: int, text: str, parse_mode: str = None,
+                         max_retries: int = None) -> Tuple[Optional[dict], bool]:
+        data = {"chat_id": chat_id, "message_id": message_id, "text": text}
+        if parse_mode:
+            data["parse_mode"] = parse_mode
+        return await self._send_text("editMessageText", data, max_retries)
+
+    async def get_file_path(self, file_id: str) -> Optional[str]:
+        """Resolve a file_id to the path used by the file download endpoint"""
+        result = await self.call("getFile", {"file_id": file_id})
+        if result and result.get("ok"):
+            return result["result"].get("file_path")
+        return None
+
+    async def download_file(self, file_path: str, dest_path: str, max_bytes: int = None) -> int:
+        """Stream a file to `dest_path` chunk by chunk; returns the size in bytes"""
+        if not settings.TG_FILE_API:
+            raise RuntimeError("Telegram token not configured")
+        session = await self.session()
+        # No total timeout for the body, only between chunks
+        timeout = aiohttp.ClientTimeout(total=None, sock_read=settings.TG_REQUEST_TIMEOUT)
+        written = 0
+        async with session.get(f"{settings.TG_FILE_API}/{file_path}", timeout=timeout) as response:
+            response.raise_for_status()
+            async with aiofiles.open(dest_path, "wb") as dest:
+                async for chunk in response.content.iter_chunked(64 * 1024):
+                    written += len(chunk)
+                    if max_bytes and written > max_bytes:
+                        raise ValueError(f"File larger than {max_bytes} bytes")
+                    await dest.write(chunk)
+        return written
+
+    def stats(self) -> dict:
+        return {
+            "sent": self.sent,
+            "failed": self.failed,
+            "rate_limited": self.rate_limited,
+            "markdown_fallbacks": self.markdown_fallbacks,
+            "split_messages": self.split_messages,
+            "chats": len(self._chats),
+            "global_bucket": self._global.stats(),
+        }
+
+class ProgressiveMessage:
+    """A placeholder message that is edited as a streamed answer grows.
+
+    Edits are throttled to TG_EDIT_INTERVAL seconds (Telegram rate-limits
+    edits per chat). Partial text is sent without parse_mode since half a
+    Markdown entity is rejected; only the final edit uses Markdown. A final
+    text over 4096 characters fills the placeholder and continues in new
+    messages.
+    """
+
+    MAX_TEXT = MAX_MESSAGE_LENGTH
+
+    def __init__(self, client: TelegramClient, chat_id: int):
+        self.client = client
+        self.chat_id = chat_id
+        self.message_id = None
+        self._shown = ""
+        self._last_edit = 0.0
+
+    async def start(self, text: str):
+        result = await self.client.send_message(self.chat_id, text)
+        if result and result.get("ok"):
+            self.message_id = result["result"]["message_id"]
+            self._shown = text
+            self._last_edit = time.monotonic()
+
+    async def update(self, text: str):
+        if not self.message_id or time.monotonic() - self._last_edit < settings.TG_EDIT_INTERVAL:
+            return
+        # Best effort: a 429 on a partial edit is not worth stalling the stream for
+        await self._edit(split_text(text, self.MAX_TEXT)[0], None, max_retries=0)
+
+    async def finish(self, text: str):
+        if not self.message_id:
+            await self.client.send_message(self.chat_id, text)
+            return
+        first, *rest = split_text(text, self.MAX_TEXT)
+        result, plain = await self._edit(first, "Markdown")
+        if not result or not result.get("ok"):
+            # Fall back to fresh messages (e.g. the placeholder was deleted)
+            await self.client.send_message(self.chat_id, text)
+            return
+        # The rest of a text whose Markdown was rejected would be rejected too
+        parse_mode = None if plain else "Markdown"
+        for chunk in rest:
+            await self.client.send_message(self.chat_id, chunk, parse_mode=parse_mode)
+
+    async def _edit(self, text: str, parse_mode: Optional[str],
+                    max_retries: int = None) -> Tuple[Optional[dict], bool]:
+        """(response, whether Markdown had to be dropped)"""
+        if text == self._shown:
+            return {"ok": True}, False  # Telegram rejects "message is not modified"
+        self._last_edit = time.monotonic()
+        try:
+            result, plain = await self.client._edit_text(self.chat_id, self.message_id, text, parse_mode, max_retries)
+        except Exception as e:
+            logger.error(f"Error editing telegram message: {e}")
+            return None, False
+        if result and result.get("ok"):
+            self._shown = text
+        return result, plain
+
+telegram_client = TelegramClient()
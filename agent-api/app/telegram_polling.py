@@ -0,0 +1,77 @@
+# Long-polling ingestion via getUpdates
+# Alternative to the webhook: no public URL needed, and a burst arrives as one batch
+
+import asyncio
+import logging
+from typing import Awaitable, Callable
+from .config import settings
+from .telegram_client import TelegramClient
+
+logger = logging.getLogger(__name__)
+
+class TelegramPoller:
+    def __init__(self, client: TelegramClient, on_update: Callable[[dict], Awaitable[None]]):
+        self.client = client
+        self.on_update = on_update
+        self.offset = None
+        self.batches = 0
+        self.updates = 0
+        self._task = None
+
+    async def start(self):
+        if self._task and not self._task.done():
+            return
+        # getUpdates is refused while a webhook is registered
+        try:
+            await self.client.call("deleteWebhook", {"drop_pending_updates": False})
+        except Exception as e:
+            logger.error(f"deleteWebhook failed: {e}")
+        self._task = asyncio.create_task(self._run(), name="telegram-poller")
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def stats(self) -> dict:
+        return {"offset": self.offset, "batches": self.batches, "updates": self.updates}
+
+    async def _run(self):
+        backoff = 1.0
+        while True:
+            try:
+                updates = await self._get_updates()
+                backoff = 1.0
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"getUpdates failed: {e}; retrying in {backoff:.0f}s")
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 30.0)
+                continue
+
+            if updates:
+                self.batches += 1
+                self.updates += len(updates)
+            for update in updates:
+                # Advance first so a failing update is not redelivered forever
+                self.offset = update["update_id"] + 1
+                try:
+                    await self.on_update(update)
+                except Exception as e:
+                    logger.error(f"Polled update {update.get('update_id')} failed: {e}")
+
+    async def _get_updates(self) -> list:
+        payload = {
+            "timeout": settings.TG_POLL_TIMEOUT,
+            "limit": settings.TG_POLL_LIMIT,
+            "allowed_updates": ["message"],
+        }
+        if self.offset is not None:
+            payload["offset"] = self.offset
+        # The HTTP request must outlive the server-side long poll
+        result = await self.client.call("getUpdates", payload, timeout=settings.TG_POLL_TIMEOUT + 10)
+        if not result or not result.get("ok"):
+            raise RuntimeError((result or {}).get("description", "no response"))
+        return result.get("result", [])
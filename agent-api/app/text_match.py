@@ -0,0 +1,38 @@
+# Multi-phrase matching helpers
+# Phrase sets are folded into a trie and emitted as one regex, so Python's re
+# branches on each character instead of retrying every alternative in turn.
+
+import re
+from typing import Iterable, Optional, Pattern
+
+def trie_pattern(phrases: Iterable[str]) -> str:
+    """Regex source matching any of `phrases`, longest match first.
+
+    "ลค", "ลบ", "ลูกค้า" becomes "ล(?:ค|บ|ูกค้า)": shared prefixes are matched
+    once and a shorter phrase that is a prefix of a longer one is an
+    optional tail, so the greedy match is always the longest phrase.
+    """
+    trie: dict = {}
+    for phrase in phrases:
+        if not phrase:
+            continue
+        node = trie
+        for ch in phrase:
+            node = node.setdefault(ch, {})
+        node[""] = {}
+
+    def build(node: dict) -> str:
+        branches = [re.escape(ch) + build(child) for ch, child in sorted(node.items()) if ch]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        if "" in node:
+            return f"(?:{body})?"
+        return body
+
+    return build(trie)
+
+def compile_phrases(phrases: Iterable[str], flags: int = 0) -> Optional[Pattern]:
+    """Compile phrases into one trie regex; None when there is nothing to match."""
+    source = trie_pattern(phrases)
+    return re.compile(source, flags) if source else None
@@ -0,0 +1,177 @@
+# Read-through cache for read-only Lark MCP tools
+# Table/field schemas and the contact directory change rarely, so repeated
+# lookups are served from memory until their TTL runs out or a write tool
+# touches the same base/table.
+
+import asyncio
+import copy
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+# Seconds each read tool's results stay fresh; TOOL_CACHE_TTLS_JSON overrides, 0 disables
+READ_TOOL_TTLS = {
+    "bitable_v1_appTable_list": 300,
+    "bitable_v1_appTableField_list": 300,
+    "bitable_v1_appTableRecord_search": 30,
+    "contact_v3_user_list": 600,
+    "contact_v3_user_get": 600,
+    "contact_v3_department_list": 600,
+    "contact_v3_department_get": 600,
+    "wiki_v2_space_getNode": 300,
+}
+
+# bitable_v1_appTable*_<verb> tools with these verbs change tables, fields or records
+WRITE_VERBS = {"create", "patch", "update", "delete", "batchCreate", "batchUpdate", "batchDelete"}
+
+def tool_base_name(name: str) -> str:
+    # "mcp__lark-tenant__bitable_v1_appTable_list" / "bitable.v1.appTable.list" -> "bitable_v1_appTable_list"
+    if name.startswith("mcp__"):
+        name = name.split("__")[-1]
+    return name.replace(".", "_")
+
+def is_write_tool(name: str) -> bool:
+    base = tool_base_name(name)
+    return base.startswith("bitable_v1_appTable") and base.rsplit("_", 1)[-1] in WRITE_VERBS
+
+def _scope(arguments: dict) -> Tuple[Optional[str], Optional[str]]:
+    """(app_token, table_id) a call reads or writes"""
+    path = arguments.get("path") or {}
+    return (
+        path.get("app_token") or arguments.get("app_token"),
+        path.get("table_id") or arguments.get("table_id"),
+    )
+
+def _canonical(arguments: dict) -> str:
+    return json.dumps(arguments, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+
+class ToolResultCache:
+    """TTL + LRU store of decoded read-tool results.
+
+    Entries remember the base/table they came from; a write to a table
+    drops that table's entries and the base-level ones (the table list),
+    a write without a table_id drops everything cached for the base.
+    """
+
+    def __init__(self, ttls: Dict[str, float], max_entries: int):
+        self.ttls = ttls
+        self.max_entries = max_entries
+        # key -> (expires_at, scope, result)
+        self._entries: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self._inflight: Dict[tuple, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def ttl(self, name: str) -> float:
+        return self.ttls.get(tool_base_name(name), 0)
+
+    async def get_or_call(self, name: str, arguments: dict, call):
+        """Return the cached result for a read tool or await `call()` once,
+        sharing it with concurrent callers asking for the same thing."""
+        ttl = self.ttl(name)
+        if ttl <= 0:
+            return await call()
+
+        key = (tool_base_name(name), _canonical(arguments))
+        entry = self._entries.get(key)
+        if entry and entry[0] > time.monotonic():
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return copy.deepcopy(entry[2])
+
+        pending = self._inflight.get(key)
+        if pending is not None:
+            self.hits += 1
+            try:
+                return copy.deepcopy(await asyncio.shield(pending))
+            except asyncio.CancelledError:
+                if not pending.cancelled():
+                    raise
+                # The caller we were waiting on gave up; fetch it ourselves
+                return await call()
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            result = await call()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # Nobody may be waiting; don't log "exception never retrieved"
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            self._store(key, _scope(arguments), result, ttl)
+            return copy.deepcopy(result)
+        finally:
+            self._inflight.pop(key, None)
+
+    def _store(self, key: tuple, scope: tuple, result, ttl: float):
+        self._entries[key] = (time.monotonic() + ttl, scope, result)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def observe(self, name: str, arguments: dict = None):
+        """Call after any tool call; writes invalidate what they may have changed."""
+        if is_write_tool(name):
+            self.invalidate(*_scope(arguments or {}))
+
+    def invalidate(self, app_token: Optional[str] = None, table_id: Optional[str] = None):
+        """Drop entries for a table (plus base-level ones), a whole base, or everything."""
+        stale = [
+            key for key, (_, (entry_app, entry_table), _) in self._entries.items()
+            if app_token is None
+            or (entry_app == app_token and (table_id is None or entry_table in (None, table_id)))
+        ]
+        for key in stale:
+            del self._entries[key]
+        if stale:
+            self.invalidations += 1
+            logger.debug(f"Tool cache: dropped {len(stale)} entries for {app_token}/{table_id}")
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+        }
+
+class CachedToolClient:
+    """Wraps anything with `call_tool(name, arguments) -> dict` (e.g. mcp_manager)
+    so reads go through the cache and writes invalidate it."""
+
+    def __init__(self, client, cache: ToolResultCache):
+        self._client = client
+        self.cache = cache
+
+    async def call_tool(self, name: str, arguments: dict = None) -> dict:
+        arguments = arguments or {}
+        try:
+            return await self.cache.get_or_call(name, arguments, lambda: self._client.call_tool(name, arguments))
+        finally:
+            # Failed writes may still have partly applied
+            self.cache.observe(name, arguments)
+
+    def __getattr__(self, attr):
+        return getattr(self._client, attr)
+
+def _ttls() -> Dict[str, float]:
+    ttls = dict(READ_TOOL_TTLS)
+    # TOOL_CACHE_TTLS_JSON='{"bitable_v1_appTableRecord_search": 0}' adds or overrides entries
+    ttls.update({tool_base_name(str(k)): float(v) for k, v in settings.TOOL_CACHE_TTLS.items()})
+    return ttls
+
+tool_cache = ToolResultCache(_ttls(), settings.TOOL_CACHE_MAX_ENTRIES)
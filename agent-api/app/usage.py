@@ -0,0 +1,78 @@
+# Token usage and prompt-cache instrumentation for OpenAI chat calls
+# Attached to the ChatOpenAI model as a callback; totals are served on /agent/usage
+
+import logging
+import time
+from typing import Optional
+from langchain_core.callbacks import BaseCallbackHandler
+
+logger = logging.getLogger(__name__)
+
+def _cached_tokens(message, llm_output: dict) -> Optional[tuple]:
+    """(input_tokens, cached_tokens, output_tokens) from one response, or
+    None when the response carries no usage.
+
+    Prefers LangChain's usage_metadata; falls back to the raw OpenAI
+    token_usage (prompt_tokens_details.cached_tokens)."""
+    usage = getattr(message, "usage_metadata", None)
+    if usage:
+        details = usage.get("input_token_details") or {}
+        return usage.get("input_tokens", 0), details.get("cache_read", 0) or 0, usage.get("output_tokens", 0)
+
+    metadata = getattr(message, "response_metadata", None) or {}
+    token_usage = metadata.get("token_usage") or (llm_output or {}).get("token_usage") or {}
+    if not token_usage:
+        return None
+    details = token_usage.get("prompt_tokens_details") or {}
+    return (
+        token_usage.get("prompt_tokens", 0) or 0,
+        details.get("cached_tokens", 0) or 0,
+        token_usage.get("completion_tokens", 0) or 0,
+    )
+
+class UsageTracker(BaseCallbackHandler):
+    """Counts input, cached and output tokens across model calls.
+
+    OpenAI caches prompt prefixes of 1024+ tokens automatically, so a
+    rising cached/input ratio shows the static system prompt is being
+    reused between requests."""
+
+    def __init__(self):
+        self.calls = 0
+        self.input_tokens = 0
+        self.cached_tokens = 0
+        self.output_tokens = 0
+        self.last_call = None
+
+    def on_llm_end(self, response, **kwargs):
+        for generations in response.generations:
+            for generation in generations:
+                message = getattr(generation, "message", None)
+                usage = _cached_tokens(message, response.llm_output)
+                if usage:
+                    self.record(*usage)
+
+    def record(self, input_tokens: int, cached_tokens: int, output_tokens: int):
+        self.calls += 1
+        self.input_tokens += input_tokens
+        self.cached_tokens += cached_tokens
+        self.output_tokens += output_tokens
+        self.last_call = {
+            "at": time.time(),
+            "input_tokens": input_tokens,
+            "cached_tokens": cached_tokens,
+            "output_tokens": output_tokens,
+        }
+        logger.debug(f"LLM usage: input={input_tokens} cached={cached_tokens} output={output_tokens}")
+
+    def stats(self) -> dict:
+        return {
+            "calls": self.calls,
+            "input_tokens": self.input_tokens,
+            "cached_tokens": self.cached_tokens,
+            "output_tokens": self.output_tokens,
+            "cache_hit_ratio": round(self.cached_tokens / self.input_tokens, 3) if self.input_tokens else 0.0,
+            "last_call": self.last_call,
+        }
+
+usage_tracker = UsageTracker()
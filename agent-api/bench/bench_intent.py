@@ -0,0 +1,114 @@
+"""Micro-benchmark: analyze_user_intent vs. the previous nested-scan implementation.
+
+Run from agent-api/:  python -m bench.bench_intent  (or python bench/bench_intent.py)
+"""
+
+import os
+import sys
+import timeit
+
+# Run as a script, the package root is not on sys.path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app.intent import analyze_user_intent
+
+SAMPLES = [
+    "เพิ่มลูกค้าใหม่ชื่อบริษัท ABC",
+    "งานวันนี้มีอะไรบ้าง",
+    "ยอดขายเดือนนี้เท่าไหร่ ขอรายงานขายด้วย",
+    "คนใหม่เข้างานวันจันทร์ เพิ่มพนักงานให้หน่อย",
+    "เช็คสินค้าในคลัง สต็อกสินค้าเหลือเท่าไหร่",
+    "ลบข้อมูลลูกค้าที่ซ้ำกัน",
+    "update task status to done for project X",
+    "สวัสดีครับ วันนี้อากาศดีจัง",
+    # Long message: a pasted meeting note
+    "สรุปประชุมวันนี้ ลูกค้า ABC ต้องการให้ทีมขายส่งใบเสนอราคาภายในวันศุกร์ "
+    "ฝ่ายคลังแจ้งว่าสินค้ารุ่นใหม่จะเข้าสัปดาห์หน้า ส่วนโปรเจคเว็บไซต์ยังติดเรื่องดีไซน์ "
+    "รบกวนเพิ่มงานติดตามให้ทีมด้วย และอัปเดตสถานะงานเก่าที่ค้างอยู่ให้เรียบร้อย",
+]
+
+# Phrases that overlap a longer match without being inside it
+OVERLAPPING = [
+    "ทำงานใหม่",
+    "เพิ่มงานใหม่",
+    "ดูสถานะงานวันนี้",
+    "ข้อมูลพนักงานใหม่",
+    "ยอดขายสินค้าใหม่",
+]
+
+def legacy_analyze_user_intent(user_text: str) -> dict:
+    """Analyze user intent and suggest appropriate table/action"""
+    text = user_text.lower()
+    
+    # Intent patterns for different table types
+    intent_mapping = {
+        "customer": {
+            "keywords": ["ลูกค้า", "ลค", "customer", "client", "คัสเตอเมอร์"],
+            "actions": ["เพิ่มลูกค้า", "ข้อมูลลูกค้า", "แก้ไขลูกค้า"]
+        },
+        "task": {
+            "keywords": ["งาน", "งน", "task", "work", "ทำงาน", "โปรเจค", "project"],
+            "actions": ["งานวันนี้", "งานใหม่", "เพิ่มงาน", "สถานะงาน"]
+        },
+        "sales": {
+            "keywords": ["ขาย", "ขย", "sale", "ยอดขาย", "เงิน", "รายได้", "กำไร"],
+            "actions": ["ยอดขาย", "สถิติขาย", "รายงานขาย"]
+        },
+        "employee": {
+            "keywords": ["พนักงาน", "คน", "ทีม", "staff", "employee", "hr"],
+            "actions": ["คนใหม่", "เพิ่มพนักงาน", "ข้อมูลพนักงาน"]
+        },
+        "inventory": {
+            "keywords": ["สินค้า", "สต็อก", "คลัง", "product", "inventory"],
+            "actions": ["เช็คสินค้า", "เพิ่มสินค้า", "สต็อกสินค้า"]
+        }
+    }
+    
+    # Check for specific table indicators
+    detected_table = None
+    confidence = 0
+    
+    for table_type, patterns in intent_mapping.items():
+        score = 0
+        # Check keywords
+        for keyword in patterns["keywords"]:
+            if keyword in text:
+                score += 2
+        
+        # Check action patterns
+        for action in patterns["actions"]:
+            if action in text:
+                score += 3
+        
+        if score > confidence:
+            confidence = score
+            detected_table = table_type
+    
+    # Detect actions
+    action_type = None
+    if any(word in text for word in ["เพิ่ม", "สร้าง", "ใหม่", "add", "create"]):
+        action_type = "create"
+    elif any(word in text for word in ["ดู", "แสดง", "ข้อมูล", "รายการ", "list", "show"]):
+        action_type = "read"
+    elif any(word in text for word in ["แก้", "อัปเดต", "เปลี่ยน", "update", "edit"]):
+        action_type = "update"
+    elif any(word in text for word in ["ลบ", "delete", "remove"]):
+        action_type = "delete"
+    
+    return {
+        "table": detected_table,
+        "action": action_type,
+        "confidence": confidence,
+        "should_ask": confidence < 2  # Ask if confidence is low
+    }
+
+def main(number: int = 2000):
+    for text in SAMPLES + OVERLAPPING:
+        assert analyze_user_intent(text) == legacy_analyze_user_intent(text), text
+
+    for name, fn in (("legacy", legacy_analyze_user_intent), ("current", analyze_user_intent)):
+        seconds = timeit.timeit(lambda: [fn(t) for t in SAMPLES], number=number)
+        per_message = seconds / (number * len(SAMPLES)) * 1e6
+        print(f"{name:8s} {per_message:8.2f} us/message")
+
+if __name__ == "__main__":
+    main()
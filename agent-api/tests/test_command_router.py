@@ -0,0 +1,41 @@
+"""Only bare read requests skip the agent; anything with a filter goes to the LLM.
+
+Run from agent-api/:  python -m pytest -q tests
+"""
+
+from types import SimpleNamespace
+import pytest
+from app import command_router as router_module
+from app.command_router import command_router
+from app.intent import analyze_user_intent
+from app.normalizer import normalize_user_text
+from app.table_helper import TableResolver
+
+@pytest.fixture(autouse=True)
+def tables(monkeypatch):
+    resolver = TableResolver({"งาน": "tblTask1", "ลูกค้า": "tblCust1"}, ["tblTask1", "tblCust1"])
+    monkeypatch.setattr(router_module, "table_resolver", resolver)
+    return resolver
+
+def _route(tables, text):
+    normalized = normalize_user_text(text)
+    _, table_id = tables.resolve(normalized)
+    ctx = SimpleNamespace(prompt=text, normalized_text=normalized, table_id=table_id,
+                          intent=analyze_user_intent(normalized))
+    hit = command_router.match(ctx)
+    return hit and (hit[0].method, hit[1].get("table_id"))
+
+@pytest.mark.parametrize("text", ["ดูงานวันนี้", "ดูสถานะงาน", "ดูข้อมูลลูกค้า ชื่อสมชาย", "เพิ่มงานใหม่"])
+def test_filters_and_writes_go_to_the_agent(tables, text):
+    assert _route(tables, text) is None
+
+@pytest.mark.parametrize("text, table_id", [
+    ("ดูข้อมูลลูกค้า", "tblCust1"),
+    ("แสดงรายการ งาน", "tblTask1"),
+    ("/search งาน", "tblTask1"),
+])
+def test_bare_reads_are_routed(tables, text, table_id):
+    assert _route(tables, text) == ("search_records", table_id)
+
+def test_table_list(tables):
+    assert _route(tables, "ดูตาราง") == ("list_tables", None)
@@ -0,0 +1,32 @@
+"""Error text is only classified by whole markers, not by digits or word fragments.
+
+Run from agent-api/:  python -m pytest -q tests
+"""
+
+import pytest
+from app.mcp_guard import ErrorCode, tool_error
+
+TOOL = "bitable_v1_appTableRecord_search"
+
+@pytest.mark.parametrize("text", [
+    "record rec4291xyz not found in view",
+    "failed to update field amount=1429 on row 429",
+    "upstream at 2024-05-01T04:29:00 429ms elapsed",
+    "session invalidated by a newer login",
+    "cache entry invalid after reload",
+])
+def test_false_positives_stay_unknown(text):
+    error = tool_error(TOOL, text)
+    assert error.code not in (ErrorCode.RATE_LIMITED, ErrorCode.INVALID)
+
+@pytest.mark.parametrize("text, code", [
+    ("HTTP 429 Too Many Requests", ErrorCode.RATE_LIMITED),
+    ("request failed with status code 429", ErrorCode.RATE_LIMITED),
+    ("frequency limit exceeded", ErrorCode.RATE_LIMITED),
+    ("invalid param: page_size", ErrorCode.INVALID),
+    ("InvalidParameter: table_id", ErrorCode.INVALID),
+    ("field validation failed", ErrorCode.INVALID),
+    ('{"code": 1254045, "msg": "FieldNameNotFound"}', ErrorCode.FIELD_NOT_FOUND),
+])
+def test_real_errors_are_classified(text, code):
+    assert tool_error(TOOL, text).code == code
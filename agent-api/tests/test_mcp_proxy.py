@@ -0,0 +1,33 @@
+"""Guarded failures of agent tool calls reach the LLM instead of aborting the run.
+
+Run from agent-api/:  python -m pytest -q tests
+"""
+
+import asyncio
+from langchain_core.messages import ToolMessage
+from langchain_mcp_adapters.tools import convert_mcp_tool_to_langchain_tool
+from mcp.types import Tool
+from app.mcp_client import _SessionProxy
+from app.mcp_guard import tool_guard
+
+class StalledSession:
+    async def call_tool(self, name, arguments=None, **kwargs):
+        await asyncio.sleep(10)
+
+class FakeManager:
+    server_name = "test-stalled"
+
+    async def wait_session(self):
+        return StalledSession()
+
+def test_timeout_becomes_tool_error_message(monkeypatch):
+    monkeypatch.setitem(tool_guard.timeouts, "bitable_v1_appTable_create", 0.05)
+    mcp_tool = Tool(name="bitable_v1_appTable_create", description="create", inputSchema={"type": "object", "properties": {}})
+    lc_tool = convert_mcp_tool_to_langchain_tool(_SessionProxy(FakeManager()), mcp_tool)
+    call = {"id": "call_1", "name": lc_tool.name, "args": {}, "type": "tool_call"}
+
+    # Raising here would propagate out of ToolNode and end the agent run
+    message = asyncio.run(lc_tool.ainvoke(call))
+
+    assert isinstance(message, ToolMessage) and message.tool_call_id == "call_1"
+    assert message.status == "error" and "timeout" in message.text
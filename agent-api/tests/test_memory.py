@@ -0,0 +1,83 @@
+"""Chat memory must survive a run that dies inside a tool.
+
+Run from agent-api/:  python -m pytest -q tests
+"""
+
+import asyncio
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+from langchain_core.tools import tool
+from langgraph.checkpoint.memory import InMemorySaver
+from langgraph.prebuilt import create_react_agent
+from app.memory import INTERRUPTED_TOOL_RESULT, ChatMemory, MemoryState, close_dangling_tool_calls, make_history_hook
+
+class FakeModel(GenericFakeChatModel):
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+@tool
+def search_lark(query: str) -> str:
+    """Search Lark"""
+    raise RuntimeError("MCP transport dropped")
+
+async def _no_summary(summary, messages):
+    return summary
+
+def test_second_turn_after_tool_raised():
+    model = FakeModel(messages=iter([
+        AIMessage(content="", tool_calls=[{"id": "call_1", "name": "search_lark", "args": {"query": "x"}}]),
+        AIMessage(content="ตอนนี้เชื่อมต่อ Lark ไม่ได้ครับ"),
+    ]))
+    agent = create_react_agent(
+        model, [search_lark], state_schema=MemoryState,
+        pre_model_hook=make_history_hook(_no_summary, 6), checkpointer=InMemorySaver(),
+    )
+    config = {"configurable": {"thread_id": "chat-1"}}
+
+    async def run():
+        try:
+            await agent.ainvoke({"messages": [HumanMessage("ดูข้อมูล")]}, config=config, durability="exit")
+        except RuntimeError:
+            pass
+        else:
+            raise AssertionError("the tool error should abort the first run")
+        return await agent.ainvoke({"messages": [HumanMessage("ลองอีกครั้ง")]}, config=config, durability="exit")
+
+    messages = asyncio.run(run())["messages"]
+    assert messages[-1].content == "ตอนนี้เชื่อมต่อ Lark ไม่ได้ครับ"
+    # The dangling call is answered in the stored history, right after its AIMessage
+    call_index = next(i for i, m in enumerate(messages) if isinstance(m, AIMessage) and m.tool_calls)
+    result = messages[call_index + 1]
+    assert isinstance(result, ToolMessage) and result.tool_call_id == "call_1"
+    assert result.content == INTERRUPTED_TOOL_RESULT
+
+def test_answered_tool_calls_are_left_alone():
+    messages = [
+        HumanMessage("a", id="h"),
+        AIMessage(content="", id="a", tool_calls=[{"id": "c", "name": "t", "args": {}}]),
+        ToolMessage(content="ok", tool_call_id="c", id="t"),
+        AIMessage(content="done", id="d"),
+    ]
+    closed, patched = close_dangling_tool_calls(messages)
+    assert not patched and closed == messages
+
+def test_fast_path_reply_is_remembered():
+    memory = ChatMemory("memory", 10, "")
+
+    async def run():
+        await memory.start()
+        agent = create_react_agent(
+            FakeModel(messages=iter([AIMessage(content="แก้แล้วครับ")])), [search_lark],
+            state_schema=MemoryState, pre_model_hook=make_history_hook(_no_summary, 6),
+            checkpointer=memory.checkpointer,
+        )
+
+        async def get_graph():
+            return agent
+
+        await memory.append(get_graph, "chat-1", [HumanMessage("ดูข้อมูลลูกค้า"), AIMessage("🔍 พบข้อมูล 1 รายการ")])
+        config = await memory.thread_config("chat-1")
+        return await agent.ainvoke({"messages": [HumanMessage("แก้อันเมื่อกี้")]}, config=config, durability="exit")
+
+    messages = asyncio.run(run())["messages"]
+    assert [m.content for m in messages] == ["ดูข้อมูลลูกค้า", "🔍 พบข้อมูล 1 รายการ", "แก้อันเมื่อกี้", "แก้แล้วครับ"]
@@ -0,0 +1,32 @@
+"""Abbreviations expand only where they are a whole Thai token.
+
+Run from agent-api/:  python -m pytest -q tests
+"""
+
+import pytest
+from app.normalizer import TextNormalizer, normalize_user_text
+
+@pytest.mark.parametrize("text", [
+    "ดูแลลูกค้า", "เพิ่มเติม", "ผู้ดูแล", "ยอดขายเพิ่มขึ้น", "อย่าลบหลู่",
+    "ขยาย", "ขยัน", "ขยับ", "ฤดูฝน", "หลบหนี", "ดูลค",
+])
+def test_abbreviations_inside_words_are_kept(text):
+    assert normalize_user_text(text) == text
+
+@pytest.mark.parametrize("text, expected", [
+    ("ดู ลค", "ดูข้อมูล ลูกค้า"),
+    ("เพิ่ม งน ใหม่", "เพิ่มข้อมูล งาน ใหม่"),
+    ("ดู", "ดูข้อมูล"),
+    ("ลบ: งน", "ลบข้อมูล: งาน"),
+])
+def test_whole_tokens_expand(text, expected):
+    assert normalize_user_text(text) == expected
+
+@pytest.mark.parametrize("text", ["ดูข้อมูลลูกค้า", "ดู ข้อมูล", "เพิ่ม ข้อมูลงาน"])
+def test_expanded_text_is_not_expanded_again(text):
+    assert normalize_user_text(text) == text
+
+def test_latin_keys_expand_as_whole_words():
+    normalizer = TextNormalizer({"cx": "customer"})
+    assert normalizer.normalize("list cx please") == "list customer please"
+    assert normalizer.normalize("cxo and xcx") == "cxo and xcx"
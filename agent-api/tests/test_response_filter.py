@@ -0,0 +1,26 @@
+"""Narration is only hidden where it opens a line; plumbing is hidden anywhere.
+
+Run from agent-api/:  python -m pytest -q tests
+"""
+
+import pytest
+from app.response_filter import is_technical_line
+
+@pytest.mark.parametrize("line", [
+    "Let me search the table",
+    "  DEBUG: retry 2",
+    "ใช้ table_id=tblTask1",
+    "ผลลัพธ์ According to the tool",
+])
+def test_technical_lines_are_hidden(line):
+    assert is_technical_line(line)
+
+@pytest.mark.parametrize("line", [
+    "ลูกค้าบอกว่า I will call back tomorrow",
+    "หมายเหตุ: Let me know ได้เลย",
+    "The result: ยอดขายเพิ่มขึ้น 10%",
+    "คอลัมน์ table_id ว่าง",
+    "สรุป Here's what we have",
+])
+def test_user_content_is_kept(line):
+    assert not is_technical_line(line)